@@ -13,8 +13,7 @@ Mantiene la primera transacción encontrada y elimina el resto.
 import sys
 from pathlib import Path
 from typing import Dict, List, Tuple
-import hashlib
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from PyQt6.QtWidgets import (
     QApplication, QDialog, QVBoxLayout, QHBoxLayout, 
@@ -26,6 +25,27 @@ from PyQt6.QtCore import Qt, QThread, pyqtSignal
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+# Permitir ejecutar el script directamente (python progain4/del_duplicate.py)
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from progain4.utils.dup_key import DUP_KEY_FIELD, dup_fields, dup_key_from_fields
+
+
+# Máximo de operaciones por WriteBatch de Firestore
+BATCH_SIZE = 500
+# Commits de lotes de borrado en vuelo a la vez
+DELETE_WORKERS = 8
+# Documentos entre señales de progreso cuando no se conoce el total
+PROGRESS_STEP_UNKNOWN = 256
+# Líneas de log agrupadas por cada señal enviada a la UI
+LOG_FLUSH_LINES = 50
+
+
+class StaleDupKeyError(Exception):
+    """Un dup_key guardado no coincide con los campos actuales de su transacción"""
+
 
 class CleanupWorker(QThread):
     """Worker thread para limpiar duplicados sin bloquear UI"""
@@ -41,25 +61,173 @@ class CleanupWorker(QThread):
         self.proyecto_id = proyecto_id
         self.dry_run = dry_run
         self._is_running = True
+        self._log_buf: List[str] = []
     
     def stop(self):
         self._is_running = False
     
-    def _generate_hash(self, trans:  Dict) -> str:
-        """Genera hash único basado en fecha, descripción y monto"""
-        try:
-            fecha = str(trans.get('fecha', ''))
-            desc = str(trans.get('descripcion', '')).strip().lower()
-            monto = f"{float(trans.get('monto', 0)):.2f}"
+    def _log(self, msg: str):
+        """Acumula líneas de log y las emite en bloques de LOG_FLUSH_LINES"""
+        self._log_buf.append(msg)
+        if len(self._log_buf) >= LOG_FLUSH_LINES:
+            self._flush_log()
+    
+    def _flush_log(self):
+        """Emite de una vez las líneas de log pendientes (QTextEdit.append acepta varias líneas)"""
+        if self._log_buf:
+            self.log.emit("\n".join(self._log_buf))
+            self._log_buf.clear()
+    
+    @staticmethod
+    def _progress_step(total: int) -> int:
+        """Cada cuántos documentos emitir progreso: ~100 actualizaciones en total"""
+        return max(1, total // 100) if total > 0 else PROGRESS_STEP_UNKNOWN
+    
+    @staticmethod
+    def _report_entry(doc_id: str, fecha, descripcion, monto) -> Dict:
+        """Solo lo que usa el reporte de duplicados"""
+        return {
+            '_doc_id': doc_id,
+            'fecha': fecha,
+            'monto': monto,
+            'descripcion': str(descripcion or '')[:60],
+        }
+    
+    def _scan_all(self, trans_ref, total: int):
+        """
+        Agrupa en cliente todas las transacciones por clave de duplicado.
+        
+        Cada grupo es [datos del primero, doc_id, doc_id, ...]: del resto solo
+        hace falta el id para eliminarlo. Las transacciones sin fecha o con monto
+        ausente o no numérico no pueden compararse y se cuentan como omitidas.
+        
+        Returns:
+            (grupos duplicados por clave, documentos leídos, omitidos), o None si se canceló
+        """
+        hash_groups = {}
+        # Claves con más de un documento, registradas al pasar de 1 a 2
+        dup_keys = []
+        
+        # Búsquedas de atributos resueltas una vez fuera del bucle
+        report_entry = self._report_entry
+        progress_emit = self.progress.emit
+        step = self._progress_step(total)
+        
+        # Recorrer el stream una sola vez, agrupando al vuelo: no se materializa
+        # la lista de documentos y de cada uno solo se guarda lo que usa el reporte
+        processed = 0
+        skipped = 0
+        for doc in trans_ref.stream():
+            if not self._is_running:
+                return None
             
-            raw = f"{fecha}|{desc}|{monto}"
-            return hashlib.md5(raw.encode('utf-8')).hexdigest()
-        except Exception as e: 
-            return f"error_{id(trans)}"
+            # Campos leídos y normalizados una sola vez por documento
+            doc_id = doc.id
+            get = (doc.to_dict() or {}).get
+            fecha, desc, monto = get('fecha'), get('descripcion'), get('monto')
+            
+            processed += 1
+            if processed % step == 0:
+                progress_emit(processed, total)
+            
+            # Validación explícita: solo la conversión del monto puede fallar
+            if fecha is None or monto is None:
+                skipped += 1
+                continue
+            try:
+                key = dup_fields(fecha, desc, monto)
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            
+            # dict normal: la clave ya vista (caso común) no pasa por __missing__
+            try:
+                bucket = hash_groups[key]
+            except KeyError:
+                hash_groups[key] = [report_entry(doc_id, fecha, desc, monto)]
+            else:
+                bucket.append(doc_id)
+                if len(bucket) == 2:
+                    dup_keys.append(key)
+        
+        return {key: hash_groups[key] for key in dup_keys}, processed, skipped
+    
+    def _scan_ordered(self, trans_ref, total: int):
+        """
+        Recorre las transacciones ordenadas por dup_key en Firestore: los
+        duplicados llegan consecutivos y solo se guardan los grupos repetidos,
+        con el mismo formato que _scan_all.
+        
+        El dup_key solo sirve para ordenar: cada documento se vuelve a normalizar
+        con dup_fields y dentro de un tramo de igual dup_key se agrupa por esos
+        campos exactos, así una colisión del prefijo SHA-1 nunca marca un
+        duplicado falso.
+        
+        Raises:
+            StaleDupKeyError: Si un documento no tiene fecha/monto válidos o su
+                dup_key no corresponde a sus campos (escrito por otra versión,
+                la consola de Firestore, etc.). Quien llama debe pasar a _scan_all.
+        
+        Returns:
+            (grupos duplicados por campos, documentos leídos, omitidos), o None si se canceló
+        """
+        dup_groups = {}
+        report_entry = self._report_entry
+        progress_emit = self.progress.emit
+        step = self._progress_step(total)
+        
+        def flush(run_groups):
+            for fields, group in run_groups.items():
+                if len(group) > 1:
+                    dup_groups[fields] = group
+        
+        run_key = object()  # Distinto de cualquier clave
+        run_groups = {}     # Campos exactos -> grupo, dentro del tramo de igual dup_key
+        processed = 0
+        for doc in trans_ref.order_by(DUP_KEY_FIELD).stream():
+            if not self._is_running:
+                return None
+            
+            doc_id = doc.id
+            get = (doc.to_dict() or {}).get
+            fecha, desc, monto = get('fecha'), get('descripcion'), get('monto')
+            stored_key = get(DUP_KEY_FIELD)
+            
+            processed += 1
+            if processed % step == 0:
+                progress_emit(processed, total)
+            
+            # Este escaneo decide qué borrar: la clave guardada debe coincidir
+            # con los campos actuales, si no, todo el índice deja de ser confiable
+            if fecha is None or monto is None:
+                raise StaleDupKeyError(doc_id)
+            try:
+                fields = dup_fields(fecha, desc, monto)
+            except (TypeError, ValueError):
+                raise StaleDupKeyError(doc_id)
+            if dup_key_from_fields(fields) != stored_key:
+                raise StaleDupKeyError(doc_id)
+            
+            if stored_key != run_key:
+                flush(run_groups)
+                run_key = stored_key
+                run_groups = {}
+            
+            group = run_groups.get(fields)
+            if group is None:
+                run_groups[fields] = [report_entry(doc_id, fecha, desc, monto)]
+            else:
+                group.append(doc_id)
+        
+        flush(run_groups)
+        
+        # Un documento inválido o desactualizado interrumpe el escaneo: no hay omitidas
+        return dup_groups, processed, 0
     
     def run(self):
         try:
-            self.log.emit("📂 Obteniendo transacciones del proyecto...")
+            self._log("📂 Obteniendo transacciones del proyecto...")
+            self._flush_log()
             
             # Obtener todas las transacciones del proyecto
             trans_ref = (
@@ -68,102 +236,154 @@ class CleanupWorker(QThread):
                 .collection('transacciones')
             )
             
-            docs = list(trans_ref.stream())
-            total = len(docs)
+            # Total estimado con una agregación de Firestore (no descarga documentos);
+            # si no está disponible, la barra de progreso queda indeterminada
+            try:
+                total = int(trans_ref.count().get()[0][0].value)
+            except Exception:
+                total = 0
+            
+            self._log(f"📊 Total de transacciones (estimado):   {total}")
+            self._log("")
             
-            self.log.emit(f"📊 Total de transacciones:   {total}")
-            self.log.emit("")
+            # Si todas las transacciones tienen dup_key, Firestore las devuelve
+            # ordenadas por esa clave; con datos legacy sin el campo se agrupa en cliente
+            indexed = -1
+            if total > 0:
+                try:
+                    indexed = int(trans_ref.order_by(DUP_KEY_FIELD).count().get()[0][0].value)
+                except Exception:
+                    indexed = -1
+            
+            self._log("🔍 Analizando duplicados...")
+            self._flush_log()
+            
+            result = None
+            use_index = indexed == total
+            if use_index:
+                self._log("⚡ Consulta ordenada por dup_key")
+                try:
+                    result = self._scan_ordered(trans_ref, total)
+                except StaleDupKeyError as e:
+                    self._log(f"⚠️ dup_key desactualizado o inválido en {e}: "
+                              f"se revisan todas las transacciones en cliente")
+                    self._flush_log()
+                    use_index = False
+            if not use_index:
+                result = self._scan_all(trans_ref, total)
+            
+            if result is None:
+                self._log("⚠️ Proceso cancelado por el usuario")
+                self._flush_log()
+                return
+            dup_groups, processed, skipped = result
+            
+            total = processed
+            self.progress.emit(total, total)
             
             if total == 0:
-                self. log.emit("⚠️ No hay transacciones en este proyecto")
+                self._log("⚠️ No hay transacciones en este proyecto")
+                self._flush_log()
                 self.finished.emit(0, 0)
                 return
             
-            # Agrupar por hash
-            hash_groups = defaultdict(list)
+            # Encontrar duplicados
+            duplicates_found = 0
+            docs_to_delete = []
             
-            self.log.emit("🔍 Analizando duplicados...")
+            # El reporte se arma como lista de líneas y se envía de una vez
+            report = ["", "=" * 70, "DUPLICADOS ENCONTRADOS:", "=" * 70]
+            add = report.append
             
-            for i, doc in enumerate(docs):
-                if not self._is_running:
-                    self.log.emit("⚠️ Proceso cancelado por el usuario")
-                    return
+            # Solo se visitan los grupos con más de un documento (registrados al escanear)
+            for group in dup_groups.values():
+                duplicates_found += 1
                 
-                data = doc.to_dict()
-                data['_doc_id'] = doc.id
+                # Mantener el primero, marcar el resto (solo ids) para eliminar
+                keep = group[0]
+                delete = group[1:]
                 
-                h = self._generate_hash(data)
-                hash_groups[h].append(data)
+                add(f"\n🔁 Duplicado #{duplicates_found}:")
+                add(f"   📅 Fecha: {keep. get('fecha')}")
+                add(f"   💰 Monto: {keep.get('monto')}")
+                add(f"   📝 Descripción:  {keep.get('descripcion', '')[:60]}...")
+                add(f"   🔢 Apariciones: {len(group)}")
+                add(f"   ✅ Mantener: {keep['_doc_id']}")
                 
-                self.progress.emit(i + 1, total)
-            
-            # Encontrar duplicados
-            duplicates_found = 0
-            docs_to_delete = []
+                report.extend([f"   ❌ Eliminar:  {dup_id}" for dup_id in delete])
+                docs_to_delete.extend(delete)
             
-            self.log.emit("")
-            self.log.emit("=" * 70)
-            self.log.emit("DUPLICADOS ENCONTRADOS:")
-            self.log.emit("=" * 70)
+            self._log("\n".join(report))
             
-            for h, group in hash_groups.items():
-                if len(group) > 1:
-                    duplicates_found += 1
-                    
-                    # Mantener el primero, marcar el resto para eliminar
-                    keep = group[0]
-                    delete = group[1:]
-                    
-                    self.log.emit(f"\n🔁 Duplicado #{duplicates_found}:")
-                    self.log.emit(f"   📅 Fecha: {keep. get('fecha')}")
-                    self.log. emit(f"   💰 Monto: {keep.get('monto')}")
-                    self.log.emit(f"   📝 Descripción:  {keep.get('descripcion', '')[:60]}...")
-                    self.log.emit(f"   🔢 Apariciones: {len(group)}")
-                    self.log.emit(f"   ✅ Mantener: {keep['_doc_id']}")
-                    
-                    for dup in delete:
-                        self.log.emit(f"   ❌ Eliminar:  {dup['_doc_id']}")
-                        docs_to_delete.append(dup['_doc_id'])
-            
-            self.log.emit("")
-            self.log.emit("=" * 70)
-            self.log.emit(f"📊 RESUMEN:")
-            self.log. emit(f"   Total transacciones: {total}")
-            self.log.emit(f"   Grupos duplicados: {duplicates_found}")
-            self.log.emit(f"   Documentos a eliminar: {len(docs_to_delete)}")
-            self.log.emit("=" * 70)
-            self.log.emit("")
+            self._log("")
+            self._log("=" * 70)
+            self._log(f"📊 RESUMEN:")
+            self._log(f"   Total transacciones: {total}")
+            if skipped:
+                self._log(f"   Omitidas (sin fecha o monto válido): {skipped}")
+            self._log(f"   Grupos duplicados: {duplicates_found}")
+            self._log(f"   Documentos a eliminar: {len(docs_to_delete)}")
+            self._log("=" * 70)
+            self._log("")
             
             # Eliminar duplicados (si no es dry run)
             deleted_count = 0
             
             if not self.dry_run and docs_to_delete:
-                self.log.emit("🗑️ Eliminando duplicados...")
+                self._log("🗑️ Eliminando duplicados...")
+                self._flush_log()
                 
-                for i, doc_id in enumerate(docs_to_delete):
-                    if not self._is_running:
-                        self.log.emit("⚠️ Eliminación cancelada")
-                        break
-                    
-                    try:
-                        trans_ref.document(doc_id).delete()
-                        deleted_count += 1
-                        self.log.emit(f"   ✅ Eliminado:  {doc_id}")
-                    except Exception as e:
-                        self.log.emit(f"   ❌ Error eliminando {doc_id}: {e}")
-                    
-                    self.progress.emit(i + 1, len(docs_to_delete))
+                # Borrado en lotes (WriteBatch admite hasta 500 operaciones por commit):
+                # un viaje de red por lote en lugar de uno por documento. Los commits
+                # solo esperan red, así que varios lotes se envían a la vez.
+                total_delete = len(docs_to_delete)
+                doc_fn = trans_ref.document
                 
-                self.log.emit("")
-                self.log.emit(f"✅ Eliminados {deleted_count} documentos duplicados")
+                def commit_chunk(chunk):
+                    batch = self.db.batch()
+                    for doc_id in chunk:
+                        batch.delete(doc_fn(doc_id))
+                    batch.commit()
+                
+                chunks = [docs_to_delete[i:i + BATCH_SIZE] for i in range(0, total_delete, BATCH_SIZE)]
+                done = 0
+                cancelled = False
+                with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+                    futures = {pool.submit(commit_chunk, chunk): chunk for chunk in chunks}
+                    for fut in as_completed(futures):
+                        chunk = futures[fut]
+                        if fut.cancelled():
+                            continue
+                        done += len(chunk)
+                        try:
+                            fut.result()
+                            deleted_count += len(chunk)
+                            self._log(f"   ✅ Eliminados {len(chunk)} documentos ({done}/{total_delete})")
+                        except Exception as e:
+                            # Un lote fallido no detiene el resto
+                            self._log(f"   ❌ Error eliminando lote {chunk[0]}..{chunk[-1]}: {e}")
+                        
+                        self.progress.emit(done, total_delete)
+                        
+                        if not self._is_running and not cancelled:
+                            # Los lotes ya enviados terminan; los pendientes no se envían
+                            cancelled = True
+                            self._log("⚠️ Eliminación cancelada")
+                            for pending in futures:
+                                pending.cancel()
+                
+                self._log("")
+                self._log(f"✅ Eliminados {deleted_count} documentos duplicados")
             
             elif self.dry_run and docs_to_delete:
-                self.log.emit("ℹ️ MODO SIMULACIÓN - No se eliminó nada")
-                self.log.emit("ℹ️ Ejecuta en modo REAL para eliminar duplicados")
+                self._log("ℹ️ MODO SIMULACIÓN - No se eliminó nada")
+                self._log("ℹ️ Ejecuta en modo REAL para eliminar duplicados")
             
+            self._flush_log()
             self.finished.emit(duplicates_found, deleted_count)
             
         except Exception as e:
+            self._flush_log()
             self. error.emit(str(e))
 
 
@@ -375,8 +595,12 @@ class DuplicateCleanerDialog(QDialog):
             self.worker.wait()
     
     def on_progress(self, current:  int, total: int):
-        """Actualiza barra de progreso"""
-        self.progress_bar.setMaximum(total)
+        """Actualiza barra de progreso (total <= 0: desconocido, barra indeterminada)"""
+        if total <= 0:
+            self.progress_bar.setRange(0, 0)
+            return
+        # El total puede ser un estimado menor que lo realmente leído
+        self.progress_bar.setRange(0, max(total, current))
         self.progress_bar.setValue(current)
     
     def on_finished(self, duplicates_found: int, deleted_count: int):
@@ -30,6 +30,8 @@ from datetime import datetime, date
 from google.cloud.firestore_v1 import FieldFilter
 from google.cloud import firestore # Para las constantes como Query.DESCENDING
 
+from progain4.utils.dup_key import DUP_KEY_FIELD, dup_key
+
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore, storage
@@ -678,6 +680,29 @@ class FirebaseClient:
             return []
 
 
+    def _with_dup_key(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copia de data con la clave de duplicado (campo dup_key) calculada a
+        partir de su fecha, descripción y monto, para que el limpiador de
+        duplicados pueda consultar las transacciones ordenadas por ella.
+
+        Args:
+            data: Datos de la transacción (no se modifican)
+
+        Returns:
+            Nuevo dict con dup_key, o sin él si fecha/monto no son válidos
+        """
+        data = dict(data)
+        fecha, monto = data.get("fecha"), data.get("monto")
+        try:
+            if fecha is None or monto is None:
+                raise ValueError("fecha/monto ausente")
+            data[DUP_KEY_FIELD] = dup_key(fecha, data.get("descripcion"), monto)
+        except (TypeError, ValueError):
+            # Sin fecha o monto válido no hay clave: el limpiador la trata como dato legacy
+            data.pop(DUP_KEY_FIELD, None)
+        return data
+
     def create_transaccion(
         self,
         proyecto_id: str,
@@ -740,6 +765,8 @@ class FirebaseClient:
             if subcategoria_id:
                 transaccion_data["subcategoria_id"] = str(subcategoria_id)
 
+            transaccion_data = self._with_dup_key(transaccion_data)
+
             # ✅ PRIORIDAD: Guardar paths si existen
             if adjuntos_paths:
                 transaccion_data["adjuntos_paths"] = adjuntos_paths
@@ -898,8 +925,8 @@ class FirebaseClient:
             trans_ingreso_data["transferencia_vinculada_id"] = trans_gasto_ref.id
             
             # Save both transactions
-            trans_gasto_ref.set(trans_gasto_data)
-            trans_ingreso_ref.set(trans_ingreso_data)
+            trans_gasto_ref.set(self._with_dup_key(trans_gasto_data))
+            trans_ingreso_ref.set(self._with_dup_key(trans_ingreso_data))
             
             logger. info(
                 f"✅ Transfer created:  {cuenta_origen_nombre} → {cuenta_destino_nombre} "
@@ -967,6 +994,16 @@ class FirebaseClient:
                 .collection("transacciones")
                 .document(transaccion_id)
             )
+
+            # Recalcular la clave de duplicado si cambia alguno de sus campos
+            if any(k in updates for k in ("fecha", "descripcion", "monto")):
+                snap = trans_ref.get()
+                merged = self._with_dup_key({**(snap.to_dict() or {}), **updates} if snap.exists else updates)
+                # Sin clave válida se borra la anterior para que no quede obsoleta
+                # (en una copia: el sentinel no debe llegar al dict del llamador)
+                updates = dict(updates)
+                updates[DUP_KEY_FIELD] = merged.get(DUP_KEY_FIELD, firestore.DELETE_FIELD)
+
             trans_ref.update(updates)
 
             logger.info(
@@ -4805,12 +4842,11 @@ class FirebaseClient:
             )
             
             if 'id' in data and data['id']:
-                doc_id = str(data['id'])
-                trans_ref. document(doc_id).set(data)
+                doc_ref = trans_ref.document(str(data['id']))
             else:
                 doc_ref = trans_ref. document()
                 data['id'] = doc_ref. id
-                doc_ref.set(data)
+            doc_ref.set(self._with_dup_key(data))
             
             # ✅ LOG con cuenta_id
             logger.info(
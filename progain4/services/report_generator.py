@@ -8,12 +8,176 @@ import pandas as pd
 import io
 import os
 import logging
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import xlsxwriter
 from fpdf import FPDF
-from openpyxl. styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 
 logger = logging.getLogger(__name__)
 
+# Formatos de los reportes Excel (xlsxwriter los registra con add_format por libro)
+_XLSX_TITLE = {'bold': True, 'font_size': 16, 'align': 'center'}
+_XLSX_SUBTITLE = {'italic': True, 'font_size': 12, 'align': 'center'}
+_XLSX_HEADER = {'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4F81BD'}
+_XLSX_LEVEL_COLORS = {
+    "Categoria": {'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#3778BE'},
+    "Subcategoria": {'font_color': '#222222', 'bg_color': '#EBF0F5'},
+    "Total": {'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#3CAADC'},
+}
+_XLSX_CUENTA_COLORS = ('#008000', '#B40000', '#000070')  # Ingresos, Gastos, Balance
+
+# A partir de este número de filas, to_excel escribe el XLSX directamente (to_excel_fast)
+FAST_EXCEL_MIN_ROWS = 50_000
+
+# Resolución de los gráficos del dashboard: suficiente para 277 mm de ancho en A4
+DASHBOARD_FIGURE_DPI = 110
+# Filas de detalle a partir de las cuales la tabla del dashboard se agrega por categoría
+DASHBOARD_MAX_PDF_ROWS = 2000
+# Tamaño (pulgadas) de los gráficos del dashboard: ~277 x 155 mm, el área de inserción
+DASHBOARD_FIGURE_SIZE = (10.9, 6.1)
+
+# Hilo dedicado a descargar/rasterizar adjuntos mientras se dibuja el cuerpo del PDF
+_ATTACHMENTS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-attachments")
+
+
+def _image_size(path):
+    """
+    Devuelve (ancho, alto) en píxeles leyendo solo la cabecera del archivo
+    para PNG y JPEG; para otros formatos recurre a PIL.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(24)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+            # Chunk IHDR: ancho y alto en bytes 16..24
+            return struct.unpack('>II', head[16:24])
+        if head.startswith(b'\xff\xd8'):
+            # Recorrer segmentos hasta el marcador SOFn (excepto DHT/JPG/DAC)
+            f.seek(2)
+            while True:
+                byte = f.read(1)
+                while byte and byte != b'\xff':
+                    byte = f.read(1)
+                while byte == b'\xff':
+                    byte = f.read(1)
+                if not byte:
+                    break
+                marker = byte[0]
+                if marker in (0x01, 0xd8) or 0xd0 <= marker <= 0xd7:
+                    continue  # marcadores sin longitud
+                seg_len = f.read(2)
+                if len(seg_len) < 2:
+                    break
+                length = struct.unpack('>H', seg_len)[0]
+                if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                    data = f.read(5)
+                    if len(data) < 5:
+                        break
+                    height, width = struct.unpack('>HH', data[1:5])
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.size
+
+
+# Reemplazos de emojis comunes por equivalentes ASCII
+_EMOJI_MAP = {
+    "📎": "[Adj]",
+    "✅": "[OK]",
+    "❌": "[X]",
+    "⚠️": "[! ]",
+    "🔗": "[Link]",
+    "📄": "[Doc]",
+    "📊": "[Chart]",
+    "💰": "[$]",
+    "🏦": "[Bank]",
+    "📈": "[Up]",
+    "📉": "[Down]",
+}
+
+
+@lru_cache(maxsize=8192)
+def _clean_text_for_pdf_cached(text: str) -> str:
+    """
+    Limpieza de texto para PDF (ver ReportGenerator._clean_text_for_pdf).
+    Memoizada: cuentas, categorías y tipos se repiten en cientos de filas.
+    """
+    for emoji, replacement in _EMOJI_MAP.items():
+        text = text.replace(emoji, replacement)
+
+    # Intentar codificar como latin-1
+    try:
+        text.encode('latin-1')
+        return text
+    except UnicodeEncodeError:
+        # Si falla, filtrar caracteres no-latin1
+        return text.encode('latin-1', errors='replace').decode('latin-1')
+
+
+def _figure_to_image(fig, dpi=None):
+    """
+    Rasteriza una figura de matplotlib a una imagen PIL (RGB) con un canvas Agg.
+
+    La figura se dibuja a un tamaño fijo (DASHBOARD_FIGURE_SIZE, la proporción
+    del área donde se inserta en el PDF) en una sola pasada y sin
+    bbox_inches='tight'. Si la figura no tiene motor de layout propio
+    (constrained/tight) se ajusta con tight_layout; si lo tiene, ese motor ya
+    recoloca los ejes al dibujar. El canvas, el dpi, el tamaño, los márgenes y
+    el motor de layout originales se restauran al terminar, para no alterar la
+    figura en el widget Qt donde se está mostrando.
+    """
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    original_canvas = fig.canvas
+    original_dpi = fig.dpi
+    original_size = fig.get_size_inches().copy()
+    sp = fig.subplotpars
+    original_margins = dict(left=sp.left, right=sp.right, bottom=sp.bottom,
+                            top=sp.top, wspace=sp.wspace, hspace=sp.hspace)
+    # tight_layout reemplaza el motor de layout de la figura (matplotlib >= 3.6)
+    get_engine = getattr(fig, 'get_layout_engine', None)
+    original_engine = get_engine() if get_engine else None
+    try:
+        canvas = FigureCanvasAgg(fig)
+        fig.set_dpi(dpi or DASHBOARD_FIGURE_DPI)
+        fig.set_size_inches(*DASHBOARD_FIGURE_SIZE, forward=False)
+        if original_engine is None:
+            try:
+                fig.tight_layout(pad=0.5)
+            except Exception:
+                pass  # p.ej. ejes incompatibles con tight_layout
+        canvas.draw()
+        return Image.fromarray(np.asarray(canvas.buffer_rgba())).convert('RGB')
+    finally:
+        if get_engine and get_engine() is not original_engine:
+            fig.set_layout_engine(original_engine)
+        if original_engine is None:
+            fig.subplots_adjust(**original_margins)
+        fig.set_size_inches(*original_size, forward=False)
+        fig.set_dpi(original_dpi)
+        fig.set_canvas(original_canvas)
+
+
+def _discard_attachments(future):
+    """Elimina los temporales de adjuntos preparados que no llegaron a usarse."""
+    try:
+        prepared = future.result()
+    except Exception:
+        return
+    for items in prepared:
+        for item in items:
+            for temp_path in [item["local_file"]] + item["pages"]:
+                if temp_path:
+                    try:
+                        os.unlink(temp_path)
+                    except OSError:
+                        pass
+
 
 class PDF(FPDF):
     def __init__(self, orientation='L', unit='mm', format='Letter', title="", project_name="", date_range=""):
@@ -21,6 +185,80 @@ class PDF(FPDF):
         self.report_title = title
         self. project_name = project_name
         self.date_range = date_range
+        # Fila de encabezado de tabla que header() repite en cada página nueva
+        self._table_header = None
+
+    def set_table_header(self, cols, widths=None, bg=None, txt=None):
+        """
+        Define la fila de encabezado de tabla que se dibuja bajo el encabezado
+        del reporte en cada página nueva. Con cols=None se deja de repetir.
+
+        Args:
+            cols: Títulos de las columnas (texto ya limpio para el PDF)
+            widths: Ancho de cada columna, en el mismo orden que cols; con None
+                se reparte el ancho útil de la página en partes iguales
+            bg: Color de fondo (r, g, b)
+            txt: Color del texto (r, g, b)
+        """
+        if not cols:
+            self._table_header = None
+            return
+        cols = list(cols)
+        if widths is None:
+            widths = [(self.w - self.l_margin - self.r_margin) / len(cols)] * len(cols)
+        self._table_header = (cols, list(widths), bg, txt)
+
+    def table_header(self):
+        """Dibuja la fila de encabezado de tabla definida con set_table_header."""
+        if not self._table_header:
+            return
+        cols, widths, bg, txt = self._table_header
+        self.set_font('Arial', 'B', 10)
+        if bg is not None:
+            self.set_fill_color(*bg)
+        if txt is not None:
+            self.set_text_color(*txt)
+        for col, w in zip(cols, widths):
+            self.cell(w, 9, col, border=0, align='C', fill=bg is not None)
+        self.ln(9)
+
+    def wrap_text(self, text, width):
+        """
+        Parte text en líneas que caben en width con la fuente actual, midiendo
+        cada palabra como multi_cell: por palabras y, si una palabra no cabe
+        sola en la línea, por caracteres.
+
+        Args:
+            text: Texto a partir (ya limpio para el PDF)
+            width: Ancho disponible, en unidades del documento
+
+        Returns:
+            Lista de líneas (al menos una, posiblemente vacía)
+        """
+        str_width = self.get_string_width
+        space_w = str_width(' ')
+        lines = []
+        for paragraph in text.split('\n'):
+            line, line_w = None, 0.0
+            for word in paragraph.split(' '):
+                word_w = str_width(word)
+                if line is not None and line_w + space_w + word_w <= width:
+                    line += ' ' + word
+                    line_w += space_w + word_w
+                    continue
+                if line is not None:
+                    lines.append(line)
+                # Palabra más ancha que la columna: se corta por caracteres
+                while word_w > width and len(word) > 1:
+                    cut = len(word) - 1
+                    while cut > 1 and str_width(word[:cut]) > width:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_w = str_width(word)
+                line, line_w = word, word_w
+            lines.append(line if line is not None else '')
+        return lines
 
     def header(self):
         # Encabezado moderno unificado para todos los reportes
@@ -49,6 +287,9 @@ class PDF(FPDF):
         self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
         self.ln(5)
 
+        # Encabezado de tabla repetido (FPDF restaura fuente y colores al salir)
+        self.table_header()
+
     def footer(self):
         self.set_y(-15)
         try:
@@ -79,8 +320,12 @@ class ReportGenerator:
         self.project_name = project_name
         self.date_range = date_range
         self.currency = currency_symbol
+        # Símbolo de moneda y separadores de miles a eliminar al leer montos formateados
+        self._amount_noise = re.compile(f"{re.escape(currency_symbol)}|,") if currency_symbol else re.compile(",")
         self.firebase_client = firebase_client
         self.proyecto_id = proyecto_id
+        # Filas máximas de la tabla de dashboard_to_pdf antes de agregar/truncar
+        self.max_pdf_rows = DASHBOARD_MAX_PDF_ROWS
 
         if data is not None:
             raw_df = pd.DataFrame([dict(row) for row in data])
@@ -105,89 +350,164 @@ class ReportGenerator:
         """
         if not isinstance(text, str):
             text = str(text)
-        
-        # Reemplazar emojis comunes por equivalentes ASCII
-        emoji_map = {
-            "📎": "[Adj]",
-            "✅": "[OK]",
-            "❌": "[X]",
-            "⚠️": "[! ]",
-            "🔗": "[Link]",
-            "📄": "[Doc]",
-            "📊": "[Chart]",
-            "💰": "[$]",
-            "🏦": "[Bank]",
-            "📈": "[Up]",
-            "📉": "[Down]",
-        }
-        
-        for emoji, replacement in emoji_map. items():
-            text = text. replace(emoji, replacement)
-        
-        # Intentar codificar como latin-1
-        try:
-            text. encode('latin-1')
-            return text
-        except UnicodeEncodeError:
-            # Si falla, filtrar caracteres no-latin1
-            cleaned = []
-            for c in text:
-                try: 
-                    c.encode('latin-1')
-                    cleaned.append(c)
-                except UnicodeEncodeError:
-                    cleaned.append('?')
-            return ''.join(cleaned)
+        return _clean_text_for_pdf_cached(text)
+
+    def _summary_widths(self, df_export, currency_cols):
+        """Anchos de columna de los reportes resumen: mínimo 15 caracteres más margen."""
+        widths = self._column_widths(df_export, padding=0, max_width=None, currency_cols=currency_cols)
+        return [max(w, 15) + 2 for w in widths]
+
+    def _to_numeric(self, series):
+        """
+        Convierte una columna de montos (numéricos o pre-formateados con moneda
+        y separadores de miles) a float en una sola pasada vectorizada.
+
+        Returns:
+            Serie de floats; NaN donde el valor no es numérico.
+        """
+        clean = series.astype(str).str.replace(self._amount_noise, "", regex=True).str.strip()
+        return pd.to_numeric(clean, errors='coerce')
+
+    def _compute_totals(self, cols):
+        """
+        Calcula los totales de ingresos y gastos a partir de las columnas genéricas
+        de monto, usando el tipo de cada fila (_raw_tipo o Tipo).
+
+        Returns:
+            Tupla (total_ingresos, total_gastos)
+        """
+        if "_raw_tipo" in self.df.columns:
+            tipos = self.df["_raw_tipo"].astype(str).str.lower()
+        elif "Tipo" in self.df.columns:
+            tipos = self.df["Tipo"].astype(str).str.lower()
+        else:
+            return 0.0, 0.0
+
+        es_ingreso = tipos.str.contains("ingreso", regex=False)
+        es_gasto = ~es_ingreso & tipos.str.contains("gasto", regex=False)
+
+        total_ingresos = 0.0
+        total_gastos = 0.0
+        for col in cols:
+            c_lower = col.lower()
+            if "monto" not in c_lower or any(k in c_lower for k in ("ingreso", "gasto", "balance")):
+                continue
+            nums = self._to_numeric(self.df[col]).abs().fillna(0)
+            total_ingresos += float(nums[es_ingreso].sum())
+            total_gastos += float(nums[es_gasto].sum())
+        return total_ingresos, total_gastos
+
+    def _column_widths(self, df_export, padding=2, max_width=50, currency_cols=()):
+        """
+        Calcula el ancho de cada columna (texto más largo, incluido el encabezado)
+        en una sola pasada vectorizada sobre el DataFrame.
+
+        Args:
+            currency_cols: Columnas que Excel mostrará con formato de moneda; se
+                miden ya formateadas ("RD$ 1,234.00") en lugar del float crudo.
+
+        Returns:
+            Lista de anchos en el orden de df_export.columns
+        """
+        as_text = df_export.astype(str)
+        for col in currency_cols:
+            nums = pd.to_numeric(df_export[col], errors='coerce')
+            formatted = nums.map(lambda x: f"{self.currency} {x:,.2f}", na_action='ignore')
+            as_text[col] = formatted.where(nums.notna(), as_text[col])
+        data_lens = as_text.apply(lambda s: s.str.len().max()).fillna(0)
+        header_lens = pd.Series([len(str(c)) for c in df_export.columns], index=df_export.columns)
+        widths = (pd.concat([data_lens, header_lens], axis=1).max(axis=1) + padding).clip(upper=max_width)
+        return [int(w) for w in widths]
+
+    def _export_frame(self):
+        """Copia de self.df sin las columnas internas (_raw_tipo, _transaction_id, _adjuntos_paths)."""
+        df_export = self.df.copy()
+        # Eliminar columnas internas si existen
+        internal_cols = ["_raw_tipo", "_transaction_id", "_adjuntos_paths"]
+        for col in internal_cols:
+            if col in df_export.columns:
+                df_export = df_export.drop(columns=[col])
+        return df_export
 
     def to_excel(self, filepath):
         if self.df.empty:
             return False, "No hay datos para exportar."
+        if len(self.df) > FAST_EXCEL_MIN_ROWS:
+            return self.to_excel_fast(filepath)
         try:
-            df_export = self.df.copy()
-            # Eliminar columnas internas si existen
-            internal_cols = ["_raw_tipo", "_transaction_id", "_adjuntos_paths"]
-            for col in internal_cols:
-                if col in df_export.columns:
-                    df_export = df_export.drop(columns=[col])
-                
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                sheet_name = 'Reporte'
-                df_export.to_excel(writer, sheet_name=sheet_name, index=False, startrow=4)
-                worksheet = writer.sheets[sheet_name]
-                
-                # Estilos
-                header_font = Font(bold=True, color="FFFFFF")
-                header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-                title_font = Font(bold=True, size=16)
-                subtitle_font = Font(italic=True, size=12)
-                
+            df_export = self._export_frame()
+
+            # constant_memory escribe cada fila a disco al completarse: memoria plana
+            # sin importar el número de filas, pero obliga a escribir en orden y a
+            # fijar los anchos de columna antes de escribir datos.
+            workbook = xlsxwriter.Workbook(filepath, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_urls': False,
+                'nan_inf_to_errors': True,
+                'default_date_format': 'yyyy-mm-dd',
+            })
+            try:
+                worksheet = workbook.add_worksheet('Reporte')
+
+                # Estilos (formatos registrados una sola vez en el libro)
+                header_fmt = workbook.add_format(_XLSX_HEADER)
+                title_fmt = workbook.add_format(_XLSX_TITLE)
+                subtitle_fmt = workbook.add_format(_XLSX_SUBTITLE)
+
+                # Ajustar anchos
+                for i, width in enumerate(self._column_widths(df_export)):
+                    worksheet.set_column(i, i, width)
+
                 # Títulos
-                last_col_letter = get_column_letter(len(df_export.columns))
-                worksheet. merge_cells(f'A1:{last_col_letter}1')
-                worksheet['A1'] = self.title
-                worksheet['A1'].font = title_font
-                worksheet['A1'].alignment = Alignment(horizontal='center')
-                
-                worksheet.merge_cells(f'A2:{last_col_letter}2')
-                worksheet['A2'] = f"Proyecto: {self.project_name} ({self.date_range})"
-                worksheet['A2'].font = subtitle_font
-                worksheet['A2'].alignment = Alignment(horizontal='center')
-                
+                last_col = len(df_export.columns) - 1
+                if last_col > 0:
+                    worksheet.merge_range(0, 0, 0, last_col, self.title, title_fmt)
+                    worksheet.merge_range(1, 0, 1, last_col,
+                                          f"Proyecto: {self.project_name} ({self.date_range})", subtitle_fmt)
+                else:
+                    worksheet.write(0, 0, self.title, title_fmt)
+                    worksheet.write(1, 0, f"Proyecto: {self.project_name} ({self.date_range})", subtitle_fmt)
+
                 # Encabezado de tabla
-                for cell in worksheet[5]:
-                    cell.font = header_font
-                    cell. fill = header_fill
-                
-                # Ajustar anchos
-                for i, col in enumerate(df_export.columns):
-                    column_letter = get_column_letter(i+1)
-                    max_len = max([len(str(val)) for val in df_export[col]] + [len(col)])
-                    worksheet.column_dimensions[column_letter].width = min(max_len + 2, 50)
+                worksheet.write_row(4, 0, [str(c) for c in df_export.columns], header_fmt)
+
+                # Datos (NaN -> celda vacía, como hace pandas.to_excel)
+                values = df_export.astype(object).where(df_export.notna(), None)
+                for r, row in enumerate(values.itertuples(index=False, name=None), start=5):
+                    worksheet.write_row(r, 0, row)
+            finally:
+                workbook.close()
 
             return True, None
         except Exception as e: 
             return False, str(e)
 
+    def to_excel_fast(self, filepath):
+        """
+        Exporta el reporte tabular escribiendo el XML del XLSX directamente.
+        Pensado para reportes muy grandes (ver FAST_EXCEL_MIN_ROWS), donde el costo
+        por celda de las librerías de Excel domina el tiempo de exportación.
+        """
+        if self.df.empty:
+            return False, "No hay datos para exportar."
+        try:
+            from progain4.utils.xlsx_fast import write_xlsx
+
+            df_export = self._export_frame()
+            values = df_export.astype(object).where(df_export.notna(), None)
+            write_xlsx(
+                filepath,
+                columns=[str(c) for c in df_export.columns],
+                rows=values.itertuples(index=False, name=None),
+                title=self.title,
+                subtitle=f"Proyecto: {self.project_name} ({self.date_range})",
+                widths=self._column_widths(df_export),
+            )
+            return True, None
+        except Exception as e:
+            return False, str(e)
+
     def to_pdf(self, filepath=None):
         """
         Genera un reporte PDF tabular genérico con soporte para adjuntos incrustados.
@@ -197,7 +517,14 @@ class ReportGenerator:
         if not filepath:
             return False, "No se indicó archivo de destino."
 
+        attachments_future = None
         try:
+            # Los adjuntos se descargan (y los PDF se rasterizan) en un hilo aparte
+            # mientras se dibuja el cuerpo: ambas fases son independientes.
+            transacciones_con_adjuntos = self._collect_attachments()
+            if transacciones_con_adjuntos:
+                attachments_future = _ATTACHMENTS_POOL.submit(self._fetch_attachments, transacciones_con_adjuntos)
+
             # 1. Configuración Inicial
             pdf = PDF(orientation='L', unit='mm', format='Letter', 
                      title=self.title, project_name=self.project_name, date_range=self.date_range)
@@ -238,59 +565,37 @@ class ReportGenerator:
             col_widths = {col: (weights[col] / total_weight) * page_width for col in cols_to_print}
             line_height = 7
 
-            # Función para imprimir encabezado de tabla
-            def print_table_header():
-                pdf.set_font('Arial', 'B', 10)
-                pdf.set_fill_color(*COLOR_HEADER_BG)
-                pdf.set_text_color(*COLOR_HEADER_TXT)
-                x = pdf.l_margin
-                for col in cols_to_print: 
-                    w = col_widths[col]
-                    # ✅ Limpiar texto del encabezado
-                    clean_col = self._clean_text_for_pdf(str(col))
-                    pdf. cell(w, 9, clean_col, border=0, align='C', fill=True)
-                pdf.ln(9)
-                # Restaurar colores base
-                pdf.set_text_color(0, 0, 0)
-                pdf.set_font('Arial', '', 9)
-
-            print_table_header()
+            # Encabezado de tabla: se dibuja aquí y PDF.header() lo repite en cada página nueva
+            # ✅ Limpiar texto del encabezado
+            pdf.set_table_header([self._clean_text_for_pdf(str(col)) for col in cols_to_print],
+                                 [col_widths[col] for col in cols_to_print],
+                                 COLOR_HEADER_BG, COLOR_HEADER_TXT)
+            pdf.table_header()
+            # Restaurar colores base
+            pdf.set_text_color(0, 0, 0)
+            pdf.set_font('Arial', '', 9)
+
+            # Ancho útil de cada columna (cell deja c_margin a cada lado) y líneas ya
+            # partidas por texto: los valores se repiten mucho entre filas
+            wrap_widths = {col: col_widths[col] - 2 * pdf.c_margin for col in cols_to_print}
+            wrapped = {}
+
+            # Totales globales (una sola pasada vectorizada, fuera del bucle de render)
+            total_ingresos, total_gastos = self._compute_totals(cols_to_print)
+
+            # Valores numéricos de las columnas de montos, convertidos una sola vez
+            # (NaN donde el texto no es un número)
+            numeric_vals = {}
+            for col in cols_to_print:
+                col_lower = col.lower()
+                if "monto" in col_lower or "balance" in col_lower or "ingresos" in col_lower or "gastos" in col_lower:
+                    numeric_vals[col] = self._to_numeric(self.df[col]).tolist()
 
             # Iterar filas
-            total_ingresos = 0.0
-            total_gastos = 0.0
             fill = False  # Para alternar colores
 
-            for idx, row in self.df.iterrows():
-                # 1. Calcular altura requerida (multi_cell)
-                max_lines = 1
-                for col in cols_to_print:
-                    val = str(row[col])
-                    w = col_widths[col]
-                    # Estimación de líneas
-                    txt_width = pdf.get_string_width(val)
-                    if txt_width > (w - 4):  # Margen interno
-                        lines = int(txt_width / (w - 4)) + 1
-                        if lines > max_lines:  max_lines = lines
-                
-                row_height = max_lines * line_height
-
-                # 2. Salto de página si no cabe
-                if pdf.get_y() + row_height > (pdf.h - pdf.b_margin):
-                    pdf.add_page()
-                    print_table_header()
-                    fill = False
-
-                # 3. Dibujar fondo alterno (Zebra striping)
-                x_start = pdf.l_margin
-                y_start = pdf.get_y()
-                
-                if fill:
-                    pdf.set_fill_color(*COLOR_ROW_ALT)
-                    # Dibujar rectángulo de fondo para toda la fila
-                    pdf.rect(x_start, y_start, page_width, row_height, 'F')
-                
-                # 4. Escribir celdas
+            for pos, (idx, row) in enumerate(self.df.iterrows()):
+                # 1. Preparar celdas (texto, estilo y líneas ya partidas)
                 # Detectar tipo para colorear montos
                 tipo_val = ""
                 if "_raw_tipo" in self.df.columns:
@@ -298,7 +603,8 @@ class ReportGenerator:
                 elif "Tipo" in row: 
                     tipo_val = str(row["Tipo"]).lower()
 
-                x_curr = x_start
+                cells = []
+                max_lines = 1
                 for col in cols_to_print:
                     val = str(row[col])
                     w = col_widths[col]
@@ -310,13 +616,10 @@ class ReportGenerator:
                     col_lower = col.lower()
                     
                     # Lógica de colores para Montos/Balance
-                    if "monto" in col_lower or "balance" in col_lower or "ingresos" in col_lower or "gastos" in col_lower:
+                    if col in numeric_vals:
                         align = 'R'
-                        try:
-                            # Limpiar símbolos si vienen pre-formateados para detectar signo
-                            clean_val = str(val).replace(self.currency, "").replace(",", "").strip()
-                            num_val = float(clean_val)
-                            
+                        num_val = numeric_vals[col][pos]
+                        if not pd.isna(num_val):
                             # Si es columna específica (ej.  Ingresos)
                             if "ingreso" in col_lower:  text_rgb = COLOR_INGRESO
                             elif "gasto" in col_lower: text_rgb = COLOR_GASTO
@@ -327,35 +630,53 @@ class ReportGenerator:
                                 if "ingreso" in tipo_val: text_rgb = COLOR_INGRESO
                                 elif "gasto" in tipo_val: text_rgb = COLOR_GASTO
                                 
-                                # Acumular totales globales
-                                if "ingreso" in tipo_val: total_ingresos += abs(num_val)
-                                elif "gasto" in tipo_val: total_gastos += abs(num_val)
-                                
                             # Formatear bonito si es número puro
                             val = f"{self.currency} {num_val:,.2f}"
-                        except:  pass
                         
                     elif "tipo" in col_lower: 
                         align = 'C'
                         if "ingreso" in val. lower(): text_rgb = COLOR_INGRESO
                         elif "gasto" in val.lower(): text_rgb = COLOR_GASTO
 
-                    pdf.set_xy(x_curr, y_start)
-                    pdf.set_text_color(*text_rgb)
-                    
-                    # ✅ Limpiar texto antes de escribir
+                    # ✅ Limpiar texto y partirlo en líneas según su ancho medido (Arial 9)
                     clean_val = self._clean_text_for_pdf(val)
-                    
-                    # pdf.cell no soporta multiline con height automático, usamos multi_cell
-                    pdf.multi_cell(w, line_height, clean_val, border=0, align=align)
-                    
+                    lines = wrapped.get((col, clean_val))
+                    if lines is None:
+                        lines = wrapped[(col, clean_val)] = pdf.wrap_text(clean_val, wrap_widths[col])
+                    if len(lines) > max_lines: max_lines = len(lines)
+                    cells.append((w, align, text_rgb, lines))
+                
+                row_height = max_lines * line_height
+
+                # 2. Salto de página si no cabe
+                if pdf.get_y() + row_height > (pdf.h - pdf.b_margin):
+                    pdf.add_page()
+                    fill = False
+
+                # 3. Dibujar fondo alterno (Zebra striping)
+                x_start = pdf.l_margin
+                y_start = pdf.get_y()
+                
+                if fill:
+                    pdf.set_fill_color(*COLOR_ROW_ALT)
+                    # Dibujar rectángulo de fondo para toda la fila
+                    pdf.rect(x_start, y_start, page_width, row_height, 'F')
+                
+                # 4. Escribir celdas (líneas ya partidas: cell evita que multi_cell vuelva a medir)
+                x_curr = x_start
+                for w, align, text_rgb, lines in cells:
+                    pdf.set_text_color(*text_rgb)
+                    for i, ln in enumerate(lines):
+                        pdf.set_xy(x_curr, y_start + i * line_height)
+                        pdf.cell(w, line_height, ln, border=0, align=align)
                     x_curr += w
 
                 # Siguiente fila
                 pdf.set_y(y_start + row_height)
                 fill = not fill  # Alternar color
 
-            # Totales Finales
+            # Totales Finales (las páginas siguientes ya no llevan encabezado de tabla)
+            pdf.set_table_header(None)
             pdf.ln(5)
             # Verificar espacio para totales
             if pdf.get_y() + 30 > (pdf.h - pdf.b_margin):
@@ -398,390 +719,384 @@ class ReportGenerator:
             pdf.cell(col_w, 10, f"{self.currency} {balance:,.2f}", 0, 1, 'C')
 
             # ========== SECCIÓN DE ADJUNTOS ==========
-            # 🔍 DEBUG: Verificar condiciones
-            logger.info(f"🔍 Verificando sección de adjuntos:")
-            logger.info(f"  - firebase_client: {self.firebase_client is not None}")
-            logger.info(f"  - proyecto_id: {self.proyecto_id}")
-            logger.info(f"  - Columnas del DF: {list(self.df.columns)}")
-            logger.info(f"  - '_adjuntos_paths' en columnas: {'_adjuntos_paths' in self.df.columns}")
-            
-            if self.firebase_client and self. proyecto_id and "_adjuntos_paths" in self.df. columns:
-                logger.info("✅ Iniciando procesamiento de adjuntos")
-                # Recolectar transacciones con adjuntos
-                transacciones_con_adjuntos = []
-                for idx, row in self.df.iterrows():
-                    adjuntos_paths = row. get("_adjuntos_paths", [])
-                    if adjuntos_paths and len(adjuntos_paths) > 0:
-                        transacciones_con_adjuntos.append({
-                            "id": row. get("_transaction_id", ""),
-                            "fecha": row.get("Fecha", ""),
-                            "descripcion": row.get("Descripción", ""),
-                            "adjuntos_paths": adjuntos_paths
-                        })
-                
-                if transacciones_con_adjuntos:
-                    from progain4.utils.attachment_downloader import download_attachment
-                    from pypdf import PdfReader
-                    from PIL import Image
-                    import tempfile
-                    
-                    logger.info(f"Processing {len(transacciones_con_adjuntos)} transactions with attachments")
-                    
-                    # Nueva página para adjuntos
-                    pdf.add_page()
-                    pdf.set_font('Arial', 'B', 16)
-                    pdf.set_text_color(44, 62, 80)
-                    pdf.cell(0, 10, 'ADJUNTOS DEL REPORTE', ln=True, align='C')
-                    pdf.ln(5)
-                    
-                    # Procesar cada transacción
-                    for trans in transacciones_con_adjuntos:
-                        # Encabezado de transacción
-                        pdf. set_font('Arial', 'B', 12)
-                        pdf.set_text_color(44, 62, 80)
-                        # ✅ Limpiar texto del encabezado
-                        clean_header = self._clean_text_for_pdf(f"Transaccion:  {trans['fecha']} - {trans['descripcion']}")
-                        pdf.cell(0, 8, clean_header, ln=True)
-                        pdf.ln(2)
-                        
-                        # Procesar cada adjunto
-                        for path in trans['adjuntos_paths']:
-                            try:
-                                # Obtener URL pública
-                                url = self.firebase_client.get_public_url_from_path(path)
-                                filename = os.path.basename(path)
-                                
-                                # Descargar archivo
-                                local_file = download_attachment(url, filename)
-                                if not local_file:
-                                    # Si falla la descarga, mostrar enlace
-                                    pdf.set_font('Arial', '', 10)
-                                    pdf.set_text_color(192, 57, 43)
-                                    clean_error = self._clean_text_for_pdf(f"[X] Error descargando:  {filename}")
-                                    pdf.cell(0, 6, clean_error, ln=True)
-                                    continue
-                                
-                                ext = os.path.splitext(filename)[1].lower()
-                                
-                                # === PROCESAR PDF ===
-                                if ext == '. pdf':
-                                    pdf. set_font('Arial', 'B', 10)
-                                    pdf.set_text_color(39, 174, 96)
-                                    clean_pdf_label = self._clean_text_for_pdf(f"[Adj] {filename} (PDF incrustado)")
-                                    pdf.cell(0, 6, clean_pdf_label, ln=True)
-                                    pdf.ln(2)
-                                    
-                                    try:
-                                        # Intentar incrustar con pdf2image
-                                        try:
-                                            from pdf2image import convert_from_path
-                                            images = convert_from_path(local_file, dpi=150)
-                                            
-                                            for page_num, img in enumerate(images):
-                                                # Guardar imagen temporal
-                                                temp_img = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                                                img.save(temp_img. name, 'PNG')
-                                                temp_img.close()
-                                                
-                                                # Agregar al PDF
-                                                pdf.add_page()
-                                                pdf.image(temp_img.name, x=10, y=30, w=pdf.w-20)
-                                                
-                                                # Limpiar
-                                                os.unlink(temp_img.name)
-                                        
-                                        except ImportError:
-                                            # Si pdf2image no está disponible, solo mostrar enlace
-                                            pdf.set_font('Arial', '', 9)
-                                            pdf.set_text_color(100, 100, 100)
-                                            pdf.cell(0, 5, "  (Instala pdf2image para incrustar PDFs)", ln=True)
-                                            pdf.set_text_color(0, 0, 255)
-                                            clean_url = self._clean_text_for_pdf(f"  Ver en linea: {url}")
-                                            pdf.cell(0, 5, clean_url, ln=True, link=url)
-                                    
-                                    except Exception as e:
-                                        logger.error(f"Error incrustando PDF {filename}: {e}")
-                                        pdf.set_font('Arial', '', 9)
-                                        pdf.set_text_color(192, 57, 43)
-                                        pdf.cell(0, 5, "  Error procesando PDF", ln=True)
-                                
-                                # === PROCESAR IMAGEN ===
-                                elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']: 
-                                    pdf.set_font('Arial', 'B', 10)
-                                    pdf.set_text_color(39, 174, 96)
-                                    clean_img_label = self._clean_text_for_pdf(f"[Adj] {filename}")
-                                    pdf.cell(0, 6, clean_img_label, ln=True)
-                                    pdf.ln(2)
-                                    
-                                    try: 
-                                        from PIL import Image
-                                        
-                                        # Obtener dimensiones de la imagen
-                                        img = Image.open(local_file)
-                                        img_width, img_height = img. size
-                                        
-                                        # Calcular dimensiones para ajustar a la página
-                                        # Márgenes:  15mm a cada lado, altura máxima:  160mm
-                                        max_width_mm = pdf.w - 30  # Ancho página - márgenes (aprox 247mm para Letter landscape)
-                                        max_height_mm = 160  # Altura máxima para no salirse
-                                        
-                                        # Convertir píxeles a mm (aproximado:  1mm = 3.78 px a 96 DPI)
-                                        img_width_mm = img_width / 3.78
-                                        img_height_mm = img_height / 3.78
-                                        
-                                        # Calcular escala para ajustar
-                                        scale_w = max_width_mm / img_width_mm if img_width_mm > max_width_mm else 1
-                                        scale_h = max_height_mm / img_height_mm if img_height_mm > max_height_mm else 1
-                                        scale = min(scale_w, scale_h)  # Usar la escala más restrictiva
-                                        
-                                        # Dimensiones finales
-                                        final_width = img_width_mm * scale
-                                        final_height = img_height_mm * scale
-                                        
-                                        # Verificar si cabe en la página actual
-                                        if pdf.get_y() + final_height + 10 > (pdf.h - pdf.b_margin):
-                                            pdf.add_page()
-                                        
-                                        # Centrar imagen horizontalmente
-                                        x_pos = (pdf.w - final_width) / 2
-                                        
-                                        # Agregar imagen ajustada
-                                        pdf. image(local_file, x=x_pos, w=final_width)
-                                        pdf.ln(5)
-                                    
-                                    except Exception as e:
-                                        logger.error(f"Error incrustando imagen {filename}: {e}")
-                                        pdf. set_font('Arial', '', 9)
-                                        pdf. set_text_color(192, 57, 43)
-                                        pdf.cell(0, 5, "  Error procesando imagen", ln=True)
-                                
-                                # === OTROS ARCHIVOS (Excel, Word, etc.) ===
-                                else:
-                                    pdf.set_font('Arial', '', 10)
-                                    pdf.set_text_color(100, 100, 100)
-                                    clean_file_label = self._clean_text_for_pdf(f"[Adj] {filename}")
-                                    pdf.cell(0, 6, clean_file_label, ln=True)
-                                    pdf.set_text_color(0, 0, 255)
-                                    clean_link = self._clean_text_for_pdf(f"  [Link] Ver en linea: {url}")
-                                    pdf.cell(0, 5, clean_link, ln=True, link=url)
-                                    pdf.ln(2)
-                                
-                                # Limpiar archivo temporal
-                                try:
-                                    os.unlink(local_file)
-                                except:
-                                    pass
-                            
-                            except Exception as e: 
-                                logger.error(f"Error procesando adjunto {path}: {e}")
-                                pdf.set_font('Arial', '', 9)
-                                pdf. set_text_color(192, 57, 43)
-                                clean_error_msg = self._clean_text_for_pdf(f"[X] Error:  {os.path.basename(path)}")
-                                pdf.cell(0, 5, clean_error_msg, ln=True)
-                        
-                        pdf.ln(5)  # Espacio entre transacciones
+            if attachments_future is not None:
+                self._render_attachments(pdf, transacciones_con_adjuntos, attachments_future.result())
 
             pdf.output(filepath)
             return True, None
 
         except Exception as e:
             logger.error(f"Error generating PDF: {e}", exc_info=True)
+            if attachments_future is not None:
+                # No se usarán: borrar los temporales cuando termine la descarga
+                attachments_future.add_done_callback(_discard_attachments)
             return False, str(e)
 
-    def to_excel_categoria(self, filepath):
-        import pandas as pd
-        from openpyxl. styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
+    def _collect_attachments(self):
+        """
+        Recolecta las transacciones del reporte que tienen adjuntos.
+
+        Returns:
+            Lista de dicts con id, fecha, descripcion y adjuntos_paths
+            (vacía si no hay cliente Firebase, proyecto o columna de adjuntos)
+        """
+        # 🔍 DEBUG: Verificar condiciones
+        logger.info(f"🔍 Verificando sección de adjuntos:")
+        logger.info(f"  - firebase_client: {self.firebase_client is not None}")
+        logger.info(f"  - proyecto_id: {self.proyecto_id}")
+        logger.info(f"  - Columnas del DF: {list(self.df.columns)}")
+        logger.info(f"  - '_adjuntos_paths' en columnas: {'_adjuntos_paths' in self.df.columns}")
+
+        transacciones_con_adjuntos = []
+        if self.firebase_client and self.proyecto_id and "_adjuntos_paths" in self.df.columns:
+            logger.info("✅ Iniciando procesamiento de adjuntos")
+            for idx, row in self.df.iterrows():
+                adjuntos_paths = row.get("_adjuntos_paths", [])
+                if adjuntos_paths and len(adjuntos_paths) > 0:
+                    transacciones_con_adjuntos.append({
+                        "id": row.get("_transaction_id", ""),
+                        "fecha": row.get("Fecha", ""),
+                        "descripcion": row.get("Descripción", ""),
+                        "adjuntos_paths": adjuntos_paths
+                    })
+        return transacciones_con_adjuntos
+
+    def _fetch_attachments(self, transacciones):
+        """
+        Descarga los adjuntos y rasteriza los PDF a PNG temporales, sin tocar el
+        documento FPDF (se ejecuta en un hilo mientras se dibuja el cuerpo).
+
+        Args:
+            transacciones: Resultado de _collect_attachments
+
+        Returns:
+            Lista paralela a `transacciones`; cada elemento es la lista de adjuntos
+            preparados (dicts con filename, url, local_file, kind y pages)
+        """
+        from progain4.utils.attachment_downloader import download_attachment
+        import tempfile
+
+        logger.info(f"Processing {len(transacciones)} transactions with attachments")
+
+        prepared = []
+        for trans in transacciones:
+            items = []
+            for path in trans['adjuntos_paths']:
+                item = {"path": path, "filename": os.path.basename(path), "url": None,
+                        "local_file": None, "kind": "error", "pages": []}
+                try:
+                    # Obtener URL pública y descargar archivo
+                    item["url"] = self.firebase_client.get_public_url_from_path(path)
+                    item["local_file"] = download_attachment(item["url"], item["filename"])
+                    if not item["local_file"]:
+                        item["kind"] = "download_error"
+                        items.append(item)
+                        continue
 
+                    ext = os.path.splitext(item["filename"])[1].lower()
+                    if ext == '.pdf':
+                        item["kind"] = "pdf"
+                        try:
+                            from pdf2image import convert_from_path
+                            for img in convert_from_path(item["local_file"], dpi=150):
+                                temp_img = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+                                img.save(temp_img.name, 'PNG')
+                                temp_img.close()
+                                item["pages"].append(temp_img.name)
+                        except ImportError:
+                            item["kind"] = "pdf_no_pdf2image"
+                        except Exception as e:
+                            logger.error(f"Error incrustando PDF {item['filename']}: {e}")
+                            item["kind"] = "pdf_error"
+                    elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
+                        item["kind"] = "image"
+                    else:
+                        item["kind"] = "other"
+                except Exception as e:
+                    logger.error(f"Error procesando adjunto {path}: {e}")
+                    item["kind"] = "error"
+                items.append(item)
+            prepared.append(items)
+        return prepared
+
+    def _render_attachments(self, pdf, transacciones, prepared):
+        """
+        Agrega la sección de adjuntos al PDF a partir de los archivos ya descargados
+        por _fetch_attachments, y elimina los temporales.
+        """
+        # Nueva página para adjuntos
+        pdf.add_page()
+        pdf.set_font('Arial', 'B', 16)
+        pdf.set_text_color(44, 62, 80)
+        pdf.cell(0, 10, 'ADJUNTOS DEL REPORTE', ln=True, align='C')
+        pdf.ln(5)
+
+        # Procesar cada transacción
+        for trans, items in zip(transacciones, prepared):
+            # Encabezado de transacción
+            pdf.set_font('Arial', 'B', 12)
+            pdf.set_text_color(44, 62, 80)
+            # ✅ Limpiar texto del encabezado
+            clean_header = self._clean_text_for_pdf(f"Transaccion:  {trans['fecha']} - {trans['descripcion']}")
+            pdf.cell(0, 8, clean_header, ln=True)
+            pdf.ln(2)
+
+            # Procesar cada adjunto
+            for item in items:
+                filename = item["filename"]
+                url = item["url"]
+                kind = item["kind"]
+                try:
+                    if kind == "error":
+                        raise RuntimeError("adjunto no disponible")
+
+                    if kind == "download_error":
+                        # Si falla la descarga, mostrar enlace
+                        pdf.set_font('Arial', '', 10)
+                        pdf.set_text_color(192, 57, 43)
+                        clean_error = self._clean_text_for_pdf(f"[X] Error descargando:  {filename}")
+                        pdf.cell(0, 6, clean_error, ln=True)
+                        continue
+
+                    # === PROCESAR PDF ===
+                    if kind.startswith("pdf"):
+                        pdf.set_font('Arial', 'B', 10)
+                        pdf.set_text_color(39, 174, 96)
+                        clean_pdf_label = self._clean_text_for_pdf(f"[Adj] {filename} (PDF incrustado)")
+                        pdf.cell(0, 6, clean_pdf_label, ln=True)
+                        pdf.ln(2)
+
+                        if kind == "pdf":
+                            for page_img in item["pages"]:
+                                pdf.add_page()
+                                pdf.image(page_img, x=10, y=30, w=pdf.w-20)
+                        elif kind == "pdf_no_pdf2image":
+                            # Si pdf2image no está disponible, solo mostrar enlace
+                            pdf.set_font('Arial', '', 9)
+                            pdf.set_text_color(100, 100, 100)
+                            pdf.cell(0, 5, "  (Instala pdf2image para incrustar PDFs)", ln=True)
+                            pdf.set_text_color(0, 0, 255)
+                            clean_url = self._clean_text_for_pdf(f"  Ver en linea: {url}")
+                            pdf.cell(0, 5, clean_url, ln=True, link=url)
+                        else:
+                            pdf.set_font('Arial', '', 9)
+                            pdf.set_text_color(192, 57, 43)
+                            pdf.cell(0, 5, "  Error procesando PDF", ln=True)
+
+                    # === PROCESAR IMAGEN ===
+                    elif kind == "image":
+                        pdf.set_font('Arial', 'B', 10)
+                        pdf.set_text_color(39, 174, 96)
+                        clean_img_label = self._clean_text_for_pdf(f"[Adj] {filename}")
+                        pdf.cell(0, 6, clean_img_label, ln=True)
+                        pdf.ln(2)
+
+                        try:
+                            # Obtener dimensiones de la imagen (solo cabecera)
+                            img_width, img_height = _image_size(item["local_file"])
+
+                            # Calcular dimensiones para ajustar a la página
+                            # Márgenes:  15mm a cada lado, altura máxima:  160mm
+                            max_width_mm = pdf.w - 30  # Ancho página - márgenes (aprox 247mm para Letter landscape)
+                            max_height_mm = 160  # Altura máxima para no salirse
+
+                            # Convertir píxeles a mm (aproximado:  1mm = 3.78 px a 96 DPI)
+                            img_width_mm = img_width / 3.78
+                            img_height_mm = img_height / 3.78
+
+                            # Calcular escala para ajustar
+                            scale_w = max_width_mm / img_width_mm if img_width_mm > max_width_mm else 1
+                            scale_h = max_height_mm / img_height_mm if img_height_mm > max_height_mm else 1
+                            scale = min(scale_w, scale_h)  # Usar la escala más restrictiva
+
+                            # Dimensiones finales
+                            final_width = img_width_mm * scale
+                            final_height = img_height_mm * scale
+
+                            # Verificar si cabe en la página actual
+                            if pdf.get_y() + final_height + 10 > (pdf.h - pdf.b_margin):
+                                pdf.add_page()
+
+                            # Centrar imagen horizontalmente
+                            x_pos = (pdf.w - final_width) / 2
+
+                            # Agregar imagen ajustada
+                            pdf.image(item["local_file"], x=x_pos, w=final_width)
+                            pdf.ln(5)
+
+                        except Exception as e:
+                            logger.error(f"Error incrustando imagen {filename}: {e}")
+                            pdf.set_font('Arial', '', 9)
+                            pdf.set_text_color(192, 57, 43)
+                            pdf.cell(0, 5, "  Error procesando imagen", ln=True)
+
+                    # === OTROS ARCHIVOS (Excel, Word, etc.) ===
+                    else:
+                        pdf.set_font('Arial', '', 10)
+                        pdf.set_text_color(100, 100, 100)
+                        clean_file_label = self._clean_text_for_pdf(f"[Adj] {filename}")
+                        pdf.cell(0, 6, clean_file_label, ln=True)
+                        pdf.set_text_color(0, 0, 255)
+                        clean_link = self._clean_text_for_pdf(f"  [Link] Ver en linea: {url}")
+                        pdf.cell(0, 5, clean_link, ln=True, link=url)
+                        pdf.ln(2)
+
+                except Exception as e:
+                    logger.error(f"Error procesando adjunto {item['path']}: {e}")
+                    pdf.set_font('Arial', '', 9)
+                    pdf.set_text_color(192, 57, 43)
+                    clean_error_msg = self._clean_text_for_pdf(f"[X] Error:  {filename}")
+                    pdf.cell(0, 5, clean_error_msg, ln=True)
+
+                finally:
+                    # Limpiar archivos temporales
+                    for temp_path in [item["local_file"]] + item["pages"]:
+                        if temp_path:
+                            try:
+                                os.unlink(temp_path)
+                            except OSError:
+                                pass
+
+            pdf.ln(5)  # Espacio entre transacciones
+
+    def _category_tree(self):
+        """
+        Agrupa self.df en la jerarquía Categoría -> Subcategoría en una sola pasada.
+
+        Las filas sin subcategoría son los totales de cada categoría; el resto se
+        agrupa por categoría con un único groupby en lugar de filtrar el DataFrame
+        completo para cada categoría.
+
+        Returns:
+            Lista de tuplas (categoria, monto, [(subcategoria, monto), ...])
+        """
+        df = self.df
+        montos = pd.to_numeric(df["Monto"], errors='coerce').fillna(0)
+        sub = df["Subcategoría"]
+        mask_sub = sub.notna() & (sub != "")
+        mask_cat = ~mask_sub & (df["Categoría"] != "TOTAL GENERAL")
+
+        frame = pd.DataFrame({"Categoría": df["Categoría"], "Subcategoría": sub, "Monto": montos})
+        sub_groups = {
+            cat: list(zip(g["Subcategoría"].tolist(), g["Monto"].tolist()))
+            for cat, g in frame.loc[mask_sub].groupby("Categoría", sort=False)
+        }
+        cats = frame.loc[mask_cat]
+        return [(cat, monto, sub_groups.get(cat, []))
+                for cat, monto in zip(cats["Categoría"].tolist(), cats["Monto"].tolist())]
+
+    def to_excel_categoria(self, filepath):
         if self.df. empty:
             return False, "No hay datos para exportar."
         try:
-            df = self.df. copy()
-            df["Monto"] = pd.to_numeric(df["Monto"], errors='coerce').fillna(0)
-            df_cats = df[(df["Subcategoría"]. isnull()) | (df["Subcategoría"] == "")]
-            categorias = df_cats[df_cats["Categoría"] != "TOTAL GENERAL"]
-
             rows = []
             total_general = 0.0
-            for _, cat_row in categorias.iterrows():
-                cat = cat_row["Categoría"]
-                total_categoria = cat_row["Monto"]
+            for cat, total_categoria, subcats in self._category_tree():
                 rows.append({"Nivel": "Categoria", "Nombre": cat, "Monto":  total_categoria})
                 total_general += total_categoria
-                subcats = df[(df["Categoría"] == cat) & (df["Subcategoría"].notnull()) & (df["Subcategoría"] != "")]
-                for _, sub_row in subcats.iterrows():
-                    rows.append({"Nivel": "Subcategoria", "Nombre": sub_row["Subcategoría"], "Monto":  sub_row["Monto"]})
+                for subcat, monto in subcats:
+                    rows.append({"Nivel": "Subcategoria", "Nombre": subcat, "Monto":  monto})
             rows.append({"Nivel": "Total", "Nombre": "TOTAL GENERAL", "Monto": total_general})
 
             df_export = pd.DataFrame(rows)
 
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                sheet_name = 'Gastos por Categoría'
-                df_export.to_excel(writer, sheet_name=sheet_name, index=False, startrow=5)
-                worksheet = writer.sheets[sheet_name]
-
-                # Estilos profesionales
-                header_font = Font(bold=True, color="FFFFFF")
-                header_fill = PatternFill(start_color="3778BE", end_color="3778BE", fill_type="solid")
-                cat_font = Font(bold=True, color="FFFFFF")
-                cat_fill = PatternFill(start_color="3778BE", end_color="3778BE", fill_type="solid")
-                subcat_font = Font(bold=False, color="222222")
-                subcat_fill = PatternFill(start_color="EBF0F5", end_color="EBF0F5", fill_type="solid")
-                total_font = Font(bold=True, color="FFFFFF")
-                total_fill = PatternFill(start_color="3CAADC", end_color="3CAADC", fill_type="solid")
-                title_font = Font(bold=True, size=16)
-                subtitle_font = Font(italic=True, size=12)
-                center_align = Alignment(horizontal='center')
-                right_align = Alignment(horizontal='right')
-                currency_format = f'"{self.currency}" #,##0.00'
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                    top=Side(style='thin'), bottom=Side(style='thin'))
+            workbook = xlsxwriter.Workbook(filepath, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_urls': False,
+                'nan_inf_to_errors': True,
+            })
+            try:
+                worksheet = workbook.add_worksheet('Gastos por Categoría')
+
+                # Formatos profesionales (registrados una sola vez en el libro)
+                currency = f'"{self.currency}" #,##0.00'
+                title_fmt = workbook.add_format(_XLSX_TITLE)
+                subtitle_fmt = workbook.add_format(_XLSX_SUBTITLE)
+                header_fmt = workbook.add_format({**_XLSX_HEADER, 'bg_color': '#3778BE',
+                                                  'align': 'center', 'border': 1})
+                level_fmts = {}
+                for nivel, colors in _XLSX_LEVEL_COLORS.items():
+                    nombre_align = 'center' if nivel == "Total" else 'left'
+                    level_fmts[nivel] = (
+                        workbook.add_format({**colors, 'border': 1, 'align': nombre_align}),
+                        workbook.add_format({**colors, 'border': 1, 'align': 'right', 'num_format': currency}),
+                    )
+                plain_fmts = (workbook.add_format({'border': 1, 'align': 'left'}),
+                              workbook.add_format({'border': 1, 'align': 'right', 'num_format': currency}))
+
+                # Ajuste de ancho de columna (antes de escribir filas)
+                for col_idx, width in enumerate(self._summary_widths(df_export, ["Monto"])):
+                    worksheet.set_column(col_idx, col_idx, width)
 
                 # Encabezados de título
-                worksheet.merge_cells('A1:C1')
-                title_cell = worksheet['A1']
-                title_cell.value = "Reporte Profesional - Gastos por Categoría"
-                title_cell.font = title_font
-                title_cell.alignment = center_align
-                worksheet.merge_cells('A2:C2')
-                project_cell = worksheet['A2']
-                project_cell.value = f"Proyecto: {self.project_name} ({self.date_range})"
-                project_cell.font = subtitle_font
-                project_cell.alignment = center_align
+                worksheet.merge_range(0, 0, 0, 2, "Reporte Profesional - Gastos por Categoría", title_fmt)
+                worksheet.merge_range(1, 0, 1, 2, f"Proyecto: {self.project_name} ({self.date_range})", subtitle_fmt)
 
                 # Encabezado de tabla
-                header_row = worksheet[6]
-                for cell in header_row:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = center_align
-                    cell.border = thin_border
-
-                # Ajuste de ancho de columna
-                for col_idx, col_name in enumerate(df_export.columns, 1):
-                    column_letter = get_column_letter(col_idx)
-                    max_length = max(len(str(cell.value)) for cell in worksheet[column_letter] if cell.value)
-                    worksheet. column_dimensions[column_letter]. width = max(max_length, 15) + 2
-
-                # Formato de filas
-                for idx, row in enumerate(df_export.itertuples(), start=7):
-                    nivel = row.Nivel
-                    nombre = row.Nombre
-                    cell_nivel = worksheet[f"A{idx}"]
-                    cell_nombre = worksheet[f"B{idx}"]
-                    cell_monto = worksheet[f"C{idx}"]
-
-                    cell_nombre.border = thin_border
-                    cell_monto.border = thin_border
-                    cell_nombre.alignment = Alignment(horizontal='left')
-                    cell_monto.alignment = right_align
-                    cell_monto.number_format = currency_format
-
-                    if nivel == "Categoria":
-                        cell_nombre.font = cat_font
-                        cell_nombre.fill = cat_fill
-                        cell_monto.font = cat_font
-                        cell_monto.fill = cat_fill
-                    elif nivel == "Subcategoria":
-                        cell_nombre.font = subcat_font
-                        cell_nombre. fill = subcat_fill
-                        cell_monto.font = subcat_font
-                        cell_monto.fill = subcat_fill
-                    elif nivel == "Total":
-                        cell_nombre.font = total_font
-                        cell_nombre. fill = total_fill
-                        cell_monto.font = total_font
-                        cell_monto.fill = total_fill
-                        cell_nombre.alignment = center_align
-                        cell_monto.alignment = right_align
+                worksheet.write_row(5, 0, list(df_export.columns), header_fmt)
+
+                # Filas con formato según el nivel (NaN -> celda vacía, p.ej. gasto sin categoría)
+                values = df_export.astype(object).where(df_export.notna(), None)
+                for r, (nivel, nombre, monto) in enumerate(values.itertuples(index=False, name=None), start=6):
+                    nombre_fmt, monto_fmt = level_fmts.get(nivel, plain_fmts)
+                    worksheet.write_string(r, 0, str(nivel))
+                    worksheet.write(r, 1, nombre, nombre_fmt)
+                    worksheet.write(r, 2, monto, monto_fmt)
+            finally:
+                workbook.close()
 
             return True, None
         except Exception as e:
             return False, str(e)
 
     def to_excel_resumen_por_cuenta(self, filepath):
-        import pandas as pd
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-
         if self. df.empty:
             return False, "No hay datos para exportar."
         try:
             df_export = self.df.copy()
-
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                sheet_name = 'Resumen por Cuenta'
-                df_export. to_excel(writer, sheet_name=sheet_name, index=False, startrow=4)
-                worksheet = writer.sheets[sheet_name]
-
-                # ---- Estilos ----
-                header_font = Font(bold=True, color="FFFFFF")
-                header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-                ingreso_font = Font(bold=False, color="008000")  # Verde
-                gasto_font = Font(bold=False, color="B40000")    # Rojo
-                balance_font = Font(bold=False, color="000070")  # Azul
-                title_font = Font(bold=True, size=16)
-                subtitle_font = Font(italic=True, size=12)
-                center_align = Alignment(horizontal='center')
-                right_align = Alignment(horizontal='right')
-                currency_format = f'"{self.currency}" #,##0.00'
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                    top=Side(style='thin'), bottom=Side(style='thin'))
+            workbook = xlsxwriter.Workbook(filepath, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_urls': False,
+                'nan_inf_to_errors': True,
+            })
+            try:
+                worksheet = workbook.add_worksheet('Resumen por Cuenta')
+
+                # ---- Formatos ----
+                currency = f'"{self.currency}" #,##0.00'
+                title_fmt = workbook.add_format(_XLSX_TITLE)
+                subtitle_fmt = workbook.add_format(_XLSX_SUBTITLE)
+                header_fmt = workbook.add_format({**_XLSX_HEADER, 'align': 'center', 'border': 1})
+                # Formato por posición de columna: Cuenta | Ingresos | Gastos | Balance
+                col_formats = [workbook.add_format({'align': 'left', 'border': 1})]
+                col_formats += [
+                    workbook.add_format({'font_color': color, 'align': 'right', 'border': 1, 'num_format': currency})
+                    for color in _XLSX_CUENTA_COLORS
+                ]
+                col_formats += [None] * (len(df_export.columns) - len(col_formats))
+
+                # Ajuste de ancho de columna (antes de escribir filas)
+                currency_cols = list(df_export.columns[1:4])
+                for col_idx, width in enumerate(self._summary_widths(df_export, currency_cols)):
+                    worksheet.set_column(col_idx, col_idx, width)
 
                 # Título y subtítulo
-                worksheet.merge_cells('A1:D1')
-                title_cell = worksheet['A1']
-                title_cell.value = self.title
-                title_cell.font = title_font
-                title_cell.alignment = center_align
-
-                worksheet.merge_cells('A2:D2')
-                project_cell = worksheet['A2']
-                project_cell.value = f"Proyecto: {self.project_name}   |   Período: {self.date_range}"
-                project_cell.font = subtitle_font
-                project_cell.alignment = center_align
+                worksheet.merge_range(0, 0, 0, 3, self.title, title_fmt)
+                worksheet.merge_range(1, 0, 1, 3, f"Proyecto: {self.project_name}   |   Período: {self.date_range}",
+                                      subtitle_fmt)
 
                 # Encabezados
-                header_row = worksheet[5]
-                for cell in header_row:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = center_align
-                    cell.border = thin_border
-
-                # Ajuste de ancho de columna
-                for col_idx, col_name in enumerate(df_export.columns, 1):
-                    column_letter = get_column_letter(col_idx)
-                    max_length = max(len(str(cell.value)) for cell in worksheet[column_letter] if cell.value)
-                    worksheet.column_dimensions[column_letter].width = max(max_length, 15) + 2
-
-                # Formato de filas
-                for idx, row in enumerate(df_export.itertuples(), start=6):
-                    # Cuenta
-                    cell_cuenta = worksheet[f"A{idx}"]
-                    cell_cuenta.alignment = Alignment(horizontal='left')
-                    cell_cuenta. border = thin_border
-
-                    # Ingresos
-                    cell_ingreso = worksheet[f"B{idx}"]
-                    cell_ingreso.number_format = currency_format
-                    cell_ingreso.font = ingreso_font
-                    cell_ingreso.alignment = right_align
-                    cell_ingreso.border = thin_border
-
-                    # Gastos
-                    cell_gasto = worksheet[f"C{idx}"]
-                    cell_gasto.number_format = currency_format
-                    cell_gasto.font = gasto_font
-                    cell_gasto.alignment = right_align
-                    cell_gasto.border = thin_border
-
-                    # Balance
-                    cell_balance = worksheet[f"D{idx}"]
-                    cell_balance.number_format = currency_format
-                    cell_balance. font = balance_font
-                    cell_balance.alignment = right_align
-                    cell_balance. border = thin_border
+                worksheet.write_row(4, 0, [str(c) for c in df_export.columns], header_fmt)
+
+                # Filas: Cuenta | Ingresos | Gastos | Balance
+                values = df_export.astype(object).where(df_export.notna(), None)
+                for r, row in enumerate(values.itertuples(index=False, name=None), start=5):
+                    for c, (val, fmt) in enumerate(zip(row, col_formats)):
+                        worksheet.write(r, c, val, fmt)
+            finally:
+                workbook.close()
 
             return True, None
         except Exception as e:
@@ -824,19 +1139,9 @@ class ReportGenerator:
             pdf.cell(page_width, 8, f"Periodo: {self.date_range}", ln=True, align='C')
             pdf.ln(5)
 
-            df = self.df.copy()
-            # Convertir monto a numérico
-            if "Monto" in df. columns:
-                df["Monto"] = pd.to_numeric(df["Monto"], errors='coerce').fillna(0)
-
-            # Filtrar categorías principales
-            df_cats = df[(df["Subcategoría"].isnull()) | (df["Subcategoría"] == "") | (df["Subcategoría"] == None)]
-            categorias = df_cats[df_cats["Categoría"] != "TOTAL GENERAL"]
             total_general = 0.0
 
-            for _, cat_row in categorias. iterrows():
-                cat = cat_row["Categoría"]
-                total_categoria = cat_row["Monto"]
+            for cat, total_categoria, subcats in self._category_tree():
                 total_general += total_categoria  # Sumamos solo categorías padre para no duplicar
 
                 # Categoría header
@@ -851,16 +1156,15 @@ class ReportGenerator:
                 pdf.ln()
 
                 # Subcategorías
-                subcats = df[(df["Categoría"] == cat) & (df["Subcategoría"].notnull()) & (df["Subcategoría"] != "")]
                 pdf.set_font("Arial", "", 10)
-                for _, sub_row in subcats. iterrows():
+                for subcat, monto in subcats:
                     pdf.set_fill_color(*COLOR_BG_SUB)
                     pdf. set_text_color(*COLOR_FONT_SUB)
                     
                     # ✅ Limpiar texto
-                    clean_sub = self._clean_text_for_pdf(f"    {sub_row['Subcategoría']}")
+                    clean_sub = self._clean_text_for_pdf(f"    {subcat}")
                     pdf.cell(int(page_width * 0.65), 8, clean_sub, border=0, align='L', fill=True)
-                    pdf.cell(int(page_width * 0.35), 8, f"{self.currency} {sub_row['Monto']:,.2f} ", border=0, align='R', fill=True)
+                    pdf.cell(int(page_width * 0.35), 8, f"{self.currency} {monto:,.2f} ", border=0, align='R', fill=True)
                     pdf.ln()
                 pdf.ln(1)  # Espacio entre grupos
 
@@ -877,11 +1181,48 @@ class ReportGenerator:
         except Exception as e:
             return False, str(e)
 
-    def dashboard_to_pdf(self, filepath, figures, order=None):
+    def _dashboard_table(self, full=False):
+        """
+        DataFrame a imprimir en la tabla de dashboard_to_pdf.
+
+        Con más de max_pdf_rows filas (y sin full) la tabla se agrega por la
+        columna de categoría sumando las columnas de montos; si no hay categoría
+        o montos, se imprimen solo las primeras max_pdf_rows filas.
+
+        Returns:
+            Tupla (DataFrame, nota para el PDF o None)
+        """
+        df = self.df
+        limit = self.max_pdf_rows
+        if full or not limit or len(df) <= limit:
+            return df, None
+
+        visibles = [c for c in df.columns if not c.startswith("_")]
+        cat_col = next((c for c in visibles if "categor" in c.lower()), None)
+        num_cols = [c for c in visibles if c != cat_col and
+                    any(k in c.lower() for k in ["monto", "balance", "ingreso", "gasto", "total"])]
+
+        if cat_col is not None and num_cols:
+            agg = pd.DataFrame({c: self._to_numeric(df[c]).fillna(0) for c in num_cols})
+            agg.insert(0, cat_col, df[cat_col].fillna("Sin Categoría").astype(str))
+            agg = agg.groupby(cat_col, as_index=False, sort=False).sum()
+            note = (f"Tabla agregada por {cat_col}: el detalle tiene {len(df):,} filas "
+                    f"(límite {limit:,}).")
+            if len(agg) > limit:
+                agg = agg.head(limit)
+                note += f" Se muestran las primeras {limit:,} categorías."
+            return agg, note
+
+        return df.head(limit), f"Se muestran las primeras {limit:,} de {len(df):,} filas."
+
+    def dashboard_to_pdf(self, filepath, figures, order=None, full=False):
         """
         Exporta un dashboard completo a PDF:  
         1. Gráficos (imágenes) al principio.  
         2. Tabla de datos detallada a continuación (usando self.df).
+
+        Si self.df supera max_pdf_rows, la tabla se agrega por categoría (o se
+        trunca) para que el PDF siga siendo manejable; full=True imprime todo.
         """
         try:
             if not figures or not isinstance(figures, dict):
@@ -899,35 +1240,44 @@ class ReportGenerator:
 
             exported_count = 0
 
+            try:
+                from matplotlib.figure import Figure
+            except ImportError:
+                Figure = None
+
+            # Resolver la figura real de cada clave (widgets/canvas exponen .figure)
+            real_figs = {}
             for key in keys:
                 fig = figures.get(key)
                 if fig is None:  continue
-
-                real_fig = fig
-                try:
-                    from matplotlib. figure import Figure
-                    if not isinstance(fig, Figure) and hasattr(fig, "figure"):
-                        real_fig = fig.figure
-                    
+                if Figure is not None and not isinstance(fig, Figure) and hasattr(fig, "figure"):
+                    fig = fig.figure
+                real_figs[key] = fig
+
+            # Plotly: cada to_image bloquea esperando a Kaleido, así que se lanzan
+            # todas a la vez en hilos. Matplotlib no es thread-safe y se rasteriza
+            # en este hilo mientras tanto.
+            plotly_keys = [k for k, f in real_figs.items() if hasattr(f, 'to_image')]
+            with ThreadPoolExecutor(max_workers=max(1, min(8, len(plotly_keys)))) as ex:
+                futs = {k: ex.submit(real_figs[k].to_image, format="png", width=1200, height=700)
+                        for k in plotly_keys}
+
+                for key, real_fig in real_figs.items():
                     # Adaptación para Plotly
-                    if hasattr(real_fig, 'to_image'):
-                        import io
-                        img_bytes = real_fig.to_image(format="png", width=1200, height=700)
-                        with io.BytesIO(img_bytes) as buf:
+                    if key in futs:
+                        with io.BytesIO(futs[key].result()) as buf:
                             pdf.add_page()
                             pdf.image(buf, x=10, y=30, w=277)
                             exported_count += 1
                         continue
-                except ImportError:  pass
 
-                # Lógica Matplotlib estándar
-                if hasattr(real_fig, 'savefig'):
-                    with io.BytesIO() as buf:
+                    # Lógica Matplotlib estándar: rasterizar con Agg y pasar la imagen
+                    # directamente a FPDF (sin codificar/decodificar PNG)
+                    if hasattr(real_fig, 'savefig'):
                         try:
-                            real_fig. savefig(buf, format='png', dpi=150, bbox_inches='tight')
-                            buf.seek(0)
+                            img = _figure_to_image(real_fig)
                             pdf.add_page()
-                            pdf.image(buf, x=10, y=30, w=277)
+                            pdf.image(img, x=10, y=30, w=277)
                             exported_count += 1
                         except Exception as e:
                             print(f"Error renderizando gráfico {key}: {e}")
@@ -935,11 +1285,17 @@ class ReportGenerator:
 
             # --- FASE 2: TABLA DE DATOS ---
             if not self.df.empty:
+                df, table_note = self._dashboard_table(full)
+
                 pdf.add_page()
                 pdf.ln(5)
                 pdf.set_font('Arial', 'B', 14)
                 pdf.set_text_color(44, 62, 80)
                 pdf.cell(0, 10, "Detalle de Datos", 0, 1, 'L')
+                if table_note:
+                    pdf.set_font('Arial', 'I', 9)
+                    pdf.set_text_color(100, 100, 100)
+                    pdf.cell(0, 6, self._clean_text_for_pdf(table_note), 0, 1, 'L')
                 pdf.ln(2)
 
                 # Configuración de Estilo
@@ -950,7 +1306,7 @@ class ReportGenerator:
                 COLOR_GASTO = (192, 57, 43)
                 COLOR_NEUTRO = (44, 62, 80)
 
-                cols_to_print = [c for c in self.df.columns if c not in ["_raw_tipo", "_transaction_id", "_adjuntos_paths"]]
+                cols_to_print = [c for c in df.columns if c not in ["_raw_tipo", "_transaction_id", "_adjuntos_paths"]]
                 
                 # Calcular anchos
                 page_width = pdf.w - 2 * pdf.l_margin
@@ -970,47 +1326,111 @@ class ReportGenerator:
                 col_widths = {col: (weights[col] / total_weight) * page_width for col in cols_to_print}
                 line_height = 7
 
-                # Encabezado Tabla
-                pdf.set_font('Arial', 'B', 10)
-                pdf.set_fill_color(*COLOR_HEADER_BG)
-                pdf.set_text_color(*COLOR_HEADER_TXT)
-                for col in cols_to_print:
-                    w = col_widths[col]
-                    # ✅ Limpiar texto
-                    clean_col = self._clean_text_for_pdf(str(col))
-                    pdf. cell(w, 9, clean_col, border=0, align='C', fill=True)
-                pdf.ln(9)
+                # Encabezado Tabla: se dibuja aquí y PDF.header() lo repite en cada página nueva
+                # ✅ Limpiar texto
+                pdf.set_table_header([self._clean_text_for_pdf(str(col)) for col in cols_to_print],
+                                     [col_widths[col] for col in cols_to_print],
+                                     COLOR_HEADER_BG, COLOR_HEADER_TXT)
+                pdf.table_header()
                 
                 pdf.set_font('Arial', '', 9)
                 fill = False
 
+                # Valores de cada columna como listas de Python, extraídos una sola vez:
+                # el bucle de filas indexa listas en lugar de construir tuplas/Series
+                n_rows = len(df)
+                col_vals = [df[c].tolist() for c in cols_to_print]
+                tipo_vals = df["_raw_tipo"].tolist() if "_raw_tipo" in df.columns else None
+
+                # Columnas numéricas: convertir y formatear una sola vez por columna
+                # (NaN / None donde el valor no es un número: se imprime tal cual)
+                num_vals = {}
+                fmt_vals = {}
+                for col in cols_to_print:
+                    if any(k in col.lower() for k in ["monto", "balance", "ingreso", "gasto", "total"]):
+                        nums = self._to_numeric(df[col])
+                        num_vals[col] = nums.tolist()
+                        fmt_vals[col] = (nums.map(lambda x: f"{self.currency} {x:,.2f}", na_action='ignore')
+                                         .astype(object).where(nums.notna(), None).tolist())
+
+                # Política de cada columna (alineación y regla de color), calculada una vez:
+                # "ingreso"/"gasto" color fijo, "balance" según signo, "fila" según el
+                # tipo de la fila (columnas genéricas como "Monto" o "Total"), "tipo"
+                # según el propio texto de la celda.
+                policies = []
+                for col in cols_to_print:
+                    col_lower = col.lower()
+                    # Detectamos columnas numéricas usando singular y plural:  "gasto", "gastos", "total", etc.
+                    if col in num_vals:
+                        if "ingreso" in col_lower: rule = "ingreso"
+                        elif "gasto" in col_lower: rule = "gasto"
+                        elif "balance" in col_lower: rule = "balance"
+                        else: rule = "fila"
+                        policies.append((col_widths[col], 'R', rule))
+                    elif "tipo" in col_lower:
+                        policies.append((col_widths[col], 'C', "tipo"))
+                    else:
+                        policies.append((col_widths[col], 'L', None))
+
+                # Texto final (formateado y limpio) de cada celda, calculado columna a columna
+                col_texts = []
+                for k, col in enumerate(cols_to_print):
+                    if col in num_vals:
+                        texts = [str(v) if f is None else f for v, f in zip(col_vals[k], fmt_vals[col])]
+                    else:
+                        texts = [str(v) for v in col_vals[k]]
+                    col_texts.append([self._clean_text_for_pdf(t) for t in texts])
+
+                # Altura de cada fila (en líneas), precalculada antes de dibujar: por
+                # columna se mide una sola vez cada texto distinto con la fuente de
+                # datos (Arial 9) y la fila toma el máximo de sus celdas.
+                row_lines = [1] * n_rows
+                for k, texts in enumerate(col_texts):
+                    avail = policies[k][0] - 4
+                    lines_of = {}
+                    for i, t in enumerate(texts):
+                        lines = lines_of.get(t)
+                        if lines is None:
+                            txt_width = pdf.get_string_width(t)
+                            lines = int(txt_width / avail) + 1 if txt_width > avail else 1
+                            lines_of[t] = lines
+                        if lines > row_lines[i]: row_lines[i] = lines
+
                 # Filas
-                for idx, row in self. df.iterrows():
-                    # Calcular altura
-                    max_lines = 1
-                    for col in cols_to_print:
-                        val = str(row[col])
-                        w = col_widths[col]
-                        txt_width = pdf.get_string_width(val)
-                        if txt_width > (w - 4):
-                            lines = int(txt_width / (w - 4)) + 1
-                            if lines > max_lines:  max_lines = lines
-                    
-                    row_height = max_lines * line_height
+                for i in range(n_rows):
+                    # Detectar tipo general de la fila (si existe) para colorear montos genéricos
+                    fila_rgb = COLOR_NEUTRO
+                    if tipo_vals is not None:
+                        tipo_row = str(tipo_vals[i]).lower()
+                        if "ingreso" in tipo_row: fila_rgb = COLOR_INGRESO
+                        elif "gasto" in tipo_row: fila_rgb = COLOR_GASTO
+
+                    # Alineación y color de cada celda
+                    cells = []
+                    for k, col in enumerate(cols_to_print):
+                        w, align, rule = policies[k]
+                        text_rgb = COLOR_NEUTRO
+
+                        if rule == "tipo":
+                            val_lower = str(col_vals[k][i]).lower()
+                            if "ingreso" in val_lower: text_rgb = COLOR_INGRESO
+                            elif "gasto" in val_lower: text_rgb = COLOR_GASTO
+                        elif rule is not None:
+                            num_val = num_vals[col][i]
+                            # Si la conversión falla (ej. es texto), dejamos el color neutro
+                            if not pd.isna(num_val):
+                                if rule == "ingreso": text_rgb = COLOR_INGRESO
+                                elif rule == "gasto": text_rgb = COLOR_GASTO
+                                elif rule == "balance": text_rgb = COLOR_INGRESO if num_val >= 0 else COLOR_GASTO
+                                else: text_rgb = fila_rgb
+
+                        cells.append((w, align, text_rgb, col_texts[k][i]))
+
+                    row_height = row_lines[i] * line_height
 
                     # Salto de página
                     if pdf.get_y() + row_height > (pdf.h - pdf.b_margin):
                         pdf. add_page()
-                        # Repetir encabezado
-                        pdf.set_font('Arial', 'B', 10)
-                        pdf.set_fill_color(*COLOR_HEADER_BG)
-                        pdf.set_text_color(*COLOR_HEADER_TXT)
-                        for col in cols_to_print:
-                            w = col_widths[col]
-                            clean_col = self._clean_text_for_pdf(str(col))
-                            pdf.cell(w, 9, clean_col, border=0, align='C', fill=True)
-                        pdf.ln(9)
-                        pdf.set_font('Arial', '', 9)
                         fill = False
 
                     # Dibujar fila
@@ -1021,54 +1441,9 @@ class ReportGenerator:
                         pdf.set_fill_color(*COLOR_ROW_ALT)
                         pdf.rect(x_curr, y_start, page_width, row_height, 'F')
 
-                    # Detectar tipo general de la fila (si existe) para colorear montos genéricos
-                    tipo_row = ""
-                    if "_raw_tipo" in self.df.columns: tipo_row = str(row["_raw_tipo"]).lower()
-
-                    for col in cols_to_print: 
-                        val = str(row[col])
-                        w = col_widths[col]
-                        align = 'L'
-                        text_rgb = COLOR_NEUTRO
-                        col_lower = col.lower()
-
-                        # Detectamos columnas numéricas usando singular y plural:  "gasto", "gastos", "total", etc.
-                        is_numeric_col = any(k in col_lower for k in ["monto", "balance", "ingreso", "gasto", "total"])
-                        
-                        if is_numeric_col:
-                            align = 'R'
-                            try:
-                                # Limpiar y convertir a número
-                                clean_val = str(val).replace(self.currency, "").replace(",", "").strip()
-                                num_val = float(clean_val)
-                                
-                                # Lógica de colores
-                                if "ingreso" in col_lower: 
-                                    text_rgb = COLOR_INGRESO
-                                elif "gasto" in col_lower:
-                                    text_rgb = COLOR_GASTO
-                                elif "balance" in col_lower:
-                                    text_rgb = COLOR_INGRESO if num_val >= 0 else COLOR_GASTO
-                                # Si la columna es genérica (ej "Monto" o "Total") usamos el tipo de fila
-                                else:
-                                    if "ingreso" in tipo_row:  text_rgb = COLOR_INGRESO
-                                    elif "gasto" in tipo_row: text_rgb = COLOR_GASTO
-                                
-                                val = f"{self.currency} {num_val:,.2f}"
-                            except:
-                                # Si falla la conversión (ej.  es texto), dejamos el color neutro
-                                pass
-                        
-                        elif "tipo" in col_lower: 
-                            align = 'C'
-                            if "ingreso" in val. lower(): text_rgb = COLOR_INGRESO
-                            elif "gasto" in val.lower(): text_rgb = COLOR_GASTO
-
+                    for w, align, text_rgb, clean_val in cells:
                         pdf.set_xy(x_curr, y_start)
                         pdf.set_text_color(*text_rgb)
-                        
-                        # ✅ Limpiar texto
-                        clean_val = self._clean_text_for_pdf(val)
                         pdf. multi_cell(w, line_height, clean_val, border=0, align=align)
                         x_curr += w
 
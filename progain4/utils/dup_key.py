@@ -0,0 +1,71 @@
+"""
+Clave de duplicado de transacciones.
+
+Dos transacciones de un proyecto se consideran duplicadas si coinciden la fecha,
+la descripción (sin espacios extremos y en minúsculas) y el monto (a 2 decimales).
+La clave se guarda en el campo ``dup_key`` al escribir cada transacción, para que
+el limpiador de duplicados pueda pedirlas ordenadas por ese campo a Firestore.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Tuple
+
+DUP_KEY_FIELD = "dup_key"
+
+
+def _fecha_norm(fecha: Any) -> str:
+    """
+    Fecha como texto estable entre escritura y lectura.
+
+    Firestore guarda los datetime sin zona como UTC y los devuelve con zona UTC,
+    así que los datetime con zona se pasan a UTC sin zona antes de serializar.
+    """
+    if isinstance(fecha, datetime):
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        return fecha.isoformat()
+    return str(fecha if fecha is not None else "")
+
+
+@lru_cache(maxsize=8192)
+def _norm_desc(desc: str) -> str:
+    """Descripción normalizada; memoizada porque los duplicados repiten el texto"""
+    return desc.strip().lower()
+
+
+@lru_cache(maxsize=1024)
+def _norm_monto(monto: Any) -> float:
+    """Monto redondeado a 2 decimales; memoizado porque los montos se repiten mucho"""
+    return round(float(monto), 2)
+
+
+def dup_fields(fecha: Any, descripcion: Any, monto: Any) -> Tuple[str, str, float]:
+    """
+    Campos normalizados que definen un duplicado.
+
+    Raises:
+        TypeError, ValueError: Si el monto no es numérico
+    """
+    return (
+        _fecha_norm(fecha),
+        _norm_desc(str(descripcion or "")),
+        _norm_monto(monto or 0),
+    )
+
+
+def dup_key(fecha: Any, descripcion: Any, monto: Any) -> str:
+    """
+    Clave compacta (16 hex de SHA-1) de los campos normalizados de dup_fields.
+
+    Raises:
+        TypeError, ValueError: Si el monto no es numérico
+    """
+    return dup_key_from_fields(dup_fields(fecha, descripcion, monto))
+
+
+def dup_key_from_fields(fields: Tuple[str, str, float]) -> str:
+    """Clave compacta de una tupla ya normalizada por dup_fields."""
+    fecha_n, desc_n, monto_n = fields
+    raw = f"{fecha_n}|{desc_n}|{monto_n:.2f}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,211 @@
+"""
+Minimal streaming XLSX writer for very large tabular exports.
+
+Writes the OOXML parts directly with zipfile instead of going through an
+Excel library, so the cost per cell is a string format and a buffered write.
+Only what the tabular report needs is supported: a title and subtitle row,
+a styled header row, column widths and plain values (text, numbers,
+booleans and dates).
+"""
+import numbers
+import re
+import zipfile
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Sequence
+from xml.sax.saxutils import escape
+
+# Caracteres de control no permitidos en XML 1.0
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Índices de estilo (cellXfs) definidos en _STYLES_XML
+_STYLE_TITLE = 1
+_STYLE_SUBTITLE = 2
+_STYLE_HEADER = 3
+_STYLE_DATE = 4
+
+_FLUSH_EVERY = 1000
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>'
+    '<fonts count="4">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="16"/><name val="Calibri"/></font>'
+    '<font><i/><sz val="12"/><name val="Calibri"/></font>'
+    '<font><b/><color rgb="FFFFFFFF"/><sz val="11"/><name val="Calibri"/></font>'
+    '</fonts>'
+    '<fills count="3">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF4F81BD"/><bgColor indexed="64"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="5">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    '<alignment horizontal="center"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    '<alignment horizontal="center"/></xf>'
+    '<xf numFmtId="0" fontId="3" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _column_letter(idx: int) -> str:
+    """Letra de columna de Excel para un índice base 1 (1 -> A, 27 -> AA)."""
+    letters = ""
+    while idx > 0:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _workbook_xml(sheet_name: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _text_cell(ref: str, text: str, style: int = 0) -> str:
+    text = escape(_ILLEGAL_XML_CHARS.sub('', text))
+    s_attr = f' s="{style}"' if style else ''
+    return f'<c r="{ref}"{s_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _value_cell(ref: str, value) -> str:
+    """Celda para un valor de datos; cadena vacía si el valor está vacío (None/NaN/NaT)."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    # numbers.* incluye los escalares de numpy; int()/float() los normalizan
+    # (en numpy 2 su repr es 'np.float64(1.5)', inválido dentro de <v>)
+    if isinstance(value, numbers.Integral):
+        return f'<c r="{ref}"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if value != value or value in (float('inf'), float('-inf')):
+            return ''
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        if value != value:  # NaT
+            return ''
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="{_STYLE_DATE}"><v>{serial!r}</v></c>'
+    if isinstance(value, date):
+        serial = (value - _EXCEL_EPOCH.date()).days
+        return f'<c r="{ref}" s="{_STYLE_DATE}"><v>{serial}</v></c>'
+    return _text_cell(ref, str(value))
+
+
+def write_xlsx(filepath: str, columns: Sequence[str], rows: Iterable[Sequence],
+               title: str = "", subtitle: str = "", widths: Optional[List[int]] = None,
+               sheet_name: str = "Reporte", startrow: int = 4) -> None:
+    """
+    Escribe un XLSX de una hoja con título, subtítulo, encabezado y filas de datos.
+
+    Args:
+        filepath: Ruta del archivo de salida
+        columns: Nombres de columna (fila de encabezado)
+        rows: Iterable de filas (secuencias de valores, en el orden de columns)
+        title: Título (fila 1, combinada sobre todas las columnas)
+        subtitle: Subtítulo (fila 2, combinada sobre todas las columnas)
+        widths: Ancho de cada columna (opcional)
+        sheet_name: Nombre de la hoja
+        startrow: Fila (base 0) del encabezado; los datos empiezan en la siguiente
+    """
+    ncols = len(columns)
+    letters = [_column_letter(i + 1) for i in range(ncols)]
+    last_letter = letters[-1] if letters else 'A'
+
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        zf.writestr('_rels/.rels', _ROOT_RELS_XML)
+        zf.writestr('xl/workbook.xml', _workbook_xml(sheet_name))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        zf.writestr('xl/styles.xml', _STYLES_XML)
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as fh:
+            head = [
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            ]
+            if widths:
+                head.append('<cols>')
+                head.extend(f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+                            for i, w in enumerate(widths, start=1))
+                head.append('</cols>')
+            head.append('<sheetData>')
+            head.append(f'<row r="1">{_text_cell("A1", title, _STYLE_TITLE)}</row>')
+            head.append(f'<row r="2">{_text_cell("A2", subtitle, _STYLE_SUBTITLE)}</row>')
+
+            header_r = startrow + 1
+            head.append(f'<row r="{header_r}">')
+            head.extend(_text_cell(f'{letters[i]}{header_r}', str(col), _STYLE_HEADER)
+                        for i, col in enumerate(columns))
+            head.append('</row>')
+            fh.write(''.join(head).encode('utf-8'))
+
+            buf = []
+            r = header_r
+            for row in rows:
+                r += 1
+                rs = str(r)
+                buf.append(f'<row r="{rs}">')
+                buf.extend(_value_cell(letters[i] + rs, v) for i, v in enumerate(row))
+                buf.append('</row>')
+                if r % _FLUSH_EVERY == 0:
+                    fh.write(''.join(buf).encode('utf-8'))
+                    buf.clear()
+            buf.append('</sheetData>')
+            if ncols > 1:
+                buf.append(f'<mergeCells count="2"><mergeCell ref="A1:{last_letter}1"/>'
+                           f'<mergeCell ref="A2:{last_letter}2"/></mergeCells>')
+            buf.append('</worksheet>')
+            fh.write(''.join(buf).encode('utf-8'))
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=['.'],
     binaries=[],
     datas=[],
-    hiddenimports=['pandas', 'plotly', 'fpdf', 'openpyxl', 'progain4.services.report_generator'],
+    hiddenimports=['pandas', 'plotly', 'fpdf', 'openpyxl', 'xlsxwriter', 'progain4.services.report_generator'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],